@@ -1,10 +1,20 @@
 #!/usr/bin/env python3
-from flask import Flask, request, jsonify, render_template, send_file, make_response, redirect, flash
+from flask import Flask, request, jsonify, render_template, send_file, make_response, redirect, flash, Response
 from flask_wtf import CSRFProtect
 from apscheduler.schedulers.background import BackgroundScheduler
-import os, json, uuid
+import os, json, uuid, hmac, hashlib, time
 import runner
+import git_mirror
+import poll_scheduler
+import run_output
+import log_reader
+import log_index
+import metrics
+import state_store
+import config_store
+import jobs
 import secrets_manager
+import ssh_pool
 from datetime import datetime
 import config_manager
 import netifaces  # type: ignore
@@ -13,10 +23,13 @@ import logging
 from functools import wraps
 from flask_wtf.csrf import CSRFError
 
-CONFIG_FILE = 'config.json'
 LOG_DIR = 'logs'
 ACTIVITY_LOG = os.path.join(LOG_DIR, 'activity.log')
 CONN_LOG = os.path.join(LOG_DIR, 'connectivity.log')
+# Seconds between keepalive comments on idle output streams
+STREAM_KEEPALIVE = 15
+# Seconds between background updates of the log index (queries also catch up first)
+LOG_INDEX_INTERVAL = 60
 
 app = Flask(__name__)
 app.secret_key = uuid.uuid4().hex
@@ -43,17 +56,6 @@ def _handle_csrf(e):
     logging.warning(f"CSRF failure on {request.path}: {e.description}")
     return jsonify({'error': 'CSRF token missing or invalid'}), 400
 
-# Load or initialize config and token
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_config(cfg):
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(cfg, f, indent=2)
-
 # Load or generate API token and encryption key
 keys = secrets_manager.load_keys()
 TOKEN = keys['api_key']
@@ -63,6 +65,9 @@ def require_token(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
         auth_header = request.headers.get('X-Auth-Token')
+        bearer = request.headers.get('Authorization', '')
+        if not auth_header and bearer.startswith('Bearer '):
+            auth_header = bearer[len('Bearer '):]
         auth_cookie = request.cookies.get('auth_token')
         auth = auth_header or auth_cookie
         logging.debug(f"AUTH CHECK {request.path} "
@@ -120,7 +125,7 @@ def logout():
 
 @app.route('/repos/view')
 def view_repos():
-    return render_template('repos.html')
+    return render_template('repos.html', fetch_strategies=git_mirror.FETCH_STRATEGIES)
 
 @app.route('/servers/view')
 def view_servers():
@@ -142,45 +147,53 @@ def view_settings():
 # Repositories CRUD
 @app.route('/api/repos', methods=['GET'])
 def get_repos():
-    cfg = load_config()
-    return jsonify(cfg.get('repos', []))
+    return jsonify(state_store.items('repos'))
 
 @app.route('/api/repos', methods=['POST'])
 @require_token
 def add_repo():
     data = request.json or {}
     name = normalize_repo(data.get('name',''))
+    if data.get('fetch') and data['fetch'] not in git_mirror.FETCH_STRATEGIES:
+        return jsonify({'error': f"fetch must be one of {', '.join(git_mirror.FETCH_STRATEGIES)}"}), 400
     # Move token to secrets storage
     secrets_list = []
     token_val = data.get('token')
     if token_val:
         secret_id = secrets_manager.store_secret(f"{name}_token", token_val)
         secrets_list.append({'key': 'token', 'id': secret_id})
+    webhook_secret = data.get('webhook_secret')
+    if webhook_secret:
+        secret_id = secrets_manager.store_secret(f"{name}_webhook_secret", webhook_secret)
+        secrets_list.append({'key': 'webhook_secret', 'id': secret_id})
     repo = {'name': name,
             'branch': data.get('branch','main'), 'active': True,
             'last_check': '1970-01-01T00:00:00', 'last_commit': ''}
+    if data.get('interval'):
+        repo['interval'] = int(data['interval'])
+    if data.get('fetch'):
+        repo['fetch'] = data['fetch']
+    if data.get('fetch_depth'):
+        repo['fetch_depth'] = int(data['fetch_depth'])
+    if data.get('reference'):
+        repo['reference'] = data['reference']
+    if data.get('deploy_debounce'):
+        repo['deploy_debounce'] = float(data['deploy_debounce'])
     if secrets_list:
         repo['secrets'] = secrets_list
-    cfg = load_config()
-    cfg.setdefault('repos', [])
-    cfg['repos'] = [r for r in cfg['repos'] if r['name']!=name]
-    cfg['repos'].append(repo)
-    save_config(cfg)
+    state_store.put('repos', repo)
     return jsonify({'status':'ok'}),201
 
 @app.route('/api/repos/<path:name>', methods=['DELETE'])
 @require_token
 def delete_repo(name):
-    cfg = load_config()
-    cfg['repos'] = [r for r in cfg.get('repos',[]) if r['name']!=name]
-    save_config(cfg)
+    state_store.delete('repos', name)
     return jsonify({'status':'ok'})
 
 # Servers CRUD
 @app.route('/api/servers', methods=['GET'])
 def get_servers():
-    cfg = load_config()
-    return jsonify(cfg.get('servers', []))
+    return jsonify(state_store.items('servers'))
 
 @app.route('/api/servers', methods=['POST'])
 @require_token
@@ -188,26 +201,21 @@ def add_server():
     data = request.json or {}
     srv = {'host':data.get('host'), 'user':data.get('user'),
            'key':data.get('key'), 'active':True, 'last_check':'1970-01-01T00:00:00'}
-    cfg = load_config()
-    cfg.setdefault('servers', [])
-    cfg['servers'] = [s for s in cfg['servers'] if s['host']!=srv['host']]
-    cfg['servers'].append(srv)
-    save_config(cfg)
+    if data.get('interval'):
+        srv['interval'] = int(data['interval'])
+    state_store.put('servers', srv)
     return jsonify({'status':'ok'}),201
 
 @app.route('/api/servers/<host>', methods=['DELETE'])
 @require_token
 def delete_server(host):
-    cfg = load_config()
-    cfg['servers'] = [s for s in cfg.get('servers',[]) if s['host']!=host]
-    save_config(cfg)
+    state_store.delete('servers', host)
     return jsonify({'status':'ok'})
 
 # Commands CRUD
 @app.route('/api/commands', methods=['GET'])
 def get_commands():
-    cfg = load_config()
-    return jsonify(cfg.get('commands', []))
+    return jsonify(state_store.items('commands'))
 
 @app.route('/api/commands', methods=['POST'])
 @require_token
@@ -221,41 +229,106 @@ def add_command_api():
         'active': True,
         'last_run': '1970-01-01T00:00:00'
     }
-    cfg = load_config()
-    cfg.setdefault('commands', [])
-    cfg['commands'] = [c for c in cfg['commands'] if c['id'] != cmd['id']]
-    cfg['commands'].append(cmd)
-    save_config(cfg)
+    state_store.put('commands', cmd)
     return jsonify(cmd), 201
 
 @app.route('/api/commands/<cmd_id>', methods=['DELETE'])
 @require_token
 def delete_command_api(cmd_id):
-    cfg = load_config()
-    cfg['commands'] = [c for c in cfg.get('commands', []) if c['id'] != cmd_id]
-    save_config(cfg)
+    state_store.delete('commands', cmd_id)
     return jsonify({'status':'ok'})
 
 @app.route('/api/commands/<cmd_id>/run', methods=['POST'])
 @require_token
 def run_command_api(cmd_id):
-    result = runner.run_command(cmd_id)
-    return jsonify(result)
+    return _enqueue(('command', cmd_id), runner.run_command, cmd_id)
+
+# Live run output (Server-Sent Events)
+def _sse(event=None, data='', event_id=None):
+    msg = ''
+    if event_id is not None:
+        msg += f"id: {event_id}\n"
+    if event:
+        msg += f"event: {event}\n"
+    return msg + f"data: {data}\n\n"
+
+def _stream_run(run, path, after):
+    """SSE events for a run: buffered lines first, then new lines as they arrive, then 'end'."""
+    run_id = run.run_id if run else os.path.basename(path)[:-len('.log')]
+    yield _sse('start', json.dumps({'run_id': run_id, 'live': run is not None}))
+    exit_status = None
+    if run:
+        for entry in run.follow(after, timeout=STREAM_KEEPALIVE):
+            if entry is None:
+                yield ': keepalive\n\n'
+                continue
+            seq, line = entry
+            yield _sse(data=line.replace('\r', ''), event_id=seq)
+        exit_status = run.exit_status
+    else:
+        # Finished run: replay its file, numbered like the live stream
+        with open(path, 'r', errors='replace') as f:
+            for seq, line in enumerate(f, 1):
+                if seq > after:
+                    yield _sse(data=line.rstrip('\r\n').replace('\r', ''), event_id=seq)
+        recorded = state_store.get_run(run_id)
+        exit_status = recorded['exit_status'] if recorded else None
+    yield _sse('end', json.dumps({'run_id': run_id, 'exit_status': exit_status}))
+
+def _stream_response(run, path):
+    after = request.headers.get('Last-Event-ID') or request.args.get('after') or 0
+    try:
+        after = int(after)
+    except ValueError:
+        after = 0
+    return Response(_stream_run(run, path, after), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/commands/<cmd_id>/stream', methods=['GET'])
+@require_token
+def stream_command(cmd_id):
+    """
+    Attach to the command's current run, waiting up to ?wait= seconds for one to
+    start. When none starts, a single 'stale' event is sent rather than replaying
+    an older run; with wait=0 the latest finished run is replayed instead.
+    """
+    wait = min(request.args.get('wait', 10, type=float), 60)
+    if wait > 0:
+        run, run_id = run_output.next_run(cmd_id, wait)
+        if not run_id:
+            stale = _sse('stale', json.dumps({'run_id': run_output.latest_run_id(cmd_id),
+                                              'error': f'No run started within {wait:g}s'}))
+            return Response(stale, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    else:
+        run, run_id = run_output.live_run(cmd_id=cmd_id), run_output.latest_run_id(cmd_id)
+    path = None if run else run_output.run_file(run_id or '')
+    if not run and not path:
+        return jsonify({'error': 'No run in progress'}), 404
+    return _stream_response(run, path)
+
+@app.route('/api/runs/<run_id>/stream', methods=['GET'])
+@require_token
+def stream_run(run_id):
+    run = run_output.live_run(run_id=run_id)
+    path = None if run else run_output.run_file(run_id)
+    if not run and not path:
+        return jsonify({'error': 'Run not found'}), 404
+    return _stream_response(run, path)
 
 @app.route('/api/commands/<cmd_id>/secrets', methods=['GET'])
 @require_token
 def get_command_secrets(cmd_id):
-    cfg = load_config()
-    cmd = next((c for c in cfg.get('commands', []) if c['id'] == cmd_id), None)
+    cmd = state_store.get('commands', cmd_id)
     if not cmd:
         return jsonify({'error':'Command not found'}), 404
+    try:
+        values = secrets_manager.get_secrets([s['id'] for s in cmd.get('secrets', [])])
+    except Exception:
+        values = {}
     masked_list = []
     for s in cmd.get('secrets', []):
-        try:
-            full = secrets_manager.get_secret(s['id'])
-            masked = secrets_manager.mask_secret(full)
-        except Exception:
-            masked = None
+        full = values.get(s['id'])
+        masked = secrets_manager.mask_secret(full) if full is not None else None
         masked_list.append({'key': s['key'], 'id': s['id'], 'value': masked})
     return jsonify(masked_list)
 
@@ -267,56 +340,121 @@ def add_command_secret(cmd_id):
     value = data.get('value')
     if not key or value is None:
         return jsonify({'error':'Missing key or value'}), 400
-    cfg = load_config()
-    for c in cfg.get('commands', []):
-        if c['id'] == cmd_id:
-            secret_id = secrets_manager.store_secret(key, value)
-            sec = c.setdefault('secrets', [])
-            sec.append({'key': key, 'id': secret_id})
-            save_config(cfg)
-            masked = secrets_manager.mask_secret(value)
-            return jsonify({'key': key, 'id': secret_id, 'value': masked}), 201
-    return jsonify({'error':'Command not found'}), 404
+    if not state_store.get('commands', cmd_id):
+        return jsonify({'error':'Command not found'}), 404
+    secret_id = secrets_manager.store_secret(key, value)
+    state_store.update('commands', cmd_id,
+                       fn=lambda c: c.setdefault('secrets', []).append({'key': key, 'id': secret_id}))
+    masked = secrets_manager.mask_secret(value)
+    return jsonify({'key': key, 'id': secret_id, 'value': masked}), 201
 
 @app.route('/api/commands/<cmd_id>/secrets/<secret_id>', methods=['DELETE'])
 @require_token
 def delete_command_secret(cmd_id, secret_id):
-    cfg = load_config()
-    for c in cfg.get('commands', []):
-        if c['id'] == cmd_id:
-            new_list = []
-            removed = False
-            for s in c.get('secrets', []):
-                if s['id'] == secret_id:
-                    secrets_manager.delete_secret(secret_id)
-                    removed = True
-                else:
-                    new_list.append(s)
-            if removed:
-                c['secrets'] = new_list
-                save_config(cfg)
-                return jsonify({'status':'ok'})
-            return jsonify({'error':'Secret not found'}), 404
-    return jsonify({'error':'Command not found'}), 404
+    cmd = state_store.get('commands', cmd_id)
+    if not cmd:
+        return jsonify({'error':'Command not found'}), 404
+    if not any(s['id'] == secret_id for s in cmd.get('secrets', [])):
+        return jsonify({'error':'Secret not found'}), 404
+    state_store.update('commands', cmd_id,
+                       fn=lambda c: c.update(secrets=[s for s in c.get('secrets', []) if s['id'] != secret_id]))
+    secrets_manager.delete_secret(secret_id)
+    return jsonify({'status':'ok'})
 
 # Manual triggers
 @app.route('/api/check/repos', methods=['POST'])
 @require_token
 def trigger_repos():
-    runner.check_repos()
-    return jsonify({'status':'ok','checked_at':datetime.utcnow().isoformat()})
+    return _enqueue(('check_repos',), runner.check_repos, join_running=True)
 
 @app.route('/api/check/servers', methods=['POST'])
 @require_token
 def trigger_servers():
-    runner.check_servers()
-    return jsonify({'status':'ok','checked_at':datetime.utcnow().isoformat()})
+    return _enqueue(('check_servers',), runner.check_servers, join_running=True)
+
+# Background jobs
+def _enqueue(key, fn, *args, join_running=False):
+    """Queue a job and answer 202 with its id. Sweeps also join a sweep that is already running."""
+    job, coalesced = job_queue.submit(key, fn, *args, join_running=join_running)
+    return jsonify({'status': 'queued', 'job_id': job['id'], 'coalesced': coalesced,
+                    'created': job['created']}), 202
+
+@app.route('/api/jobs', methods=['GET'])
+@require_token
+def list_jobs():
+    return jsonify(job_queue.list(request.args.get('limit', 50, type=int)))
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@require_token
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+# GitHub push webhooks
+def _webhook_secret(repo):
+    for s in repo.get('secrets', []):
+        if s.get('key') == 'webhook_secret':
+            return secrets_manager.get_secret(s['id'])
+    return None
+
+@app.route('/api/webhooks/github', methods=['POST'])
+@csrf.exempt
+def github_webhook():
+    received_at = time.time()
+    event = request.headers.get('X-GitHub-Event', '')
+    payload = request.get_json(silent=True) or {}
+    name = (payload.get('repository') or {}).get('full_name', '')
+    cfg = config_store.load_config()
+    repo = next((r for r in cfg.get('repos', []) if r['name'].lower() == name.lower()), None)
+    if not repo:
+        return jsonify({'error': 'Repository not enrolled'}), 404
+    # The signature is the only authentication: repos without a webhook secret are refused
+    secret = _webhook_secret(repo)
+    signature = request.headers.get('X-Hub-Signature-256', '')
+    expected = 'sha256=' + hmac.new(secret.encode(), request.get_data(), hashlib.sha256).hexdigest() if secret else ''
+    if not secret or not hmac.compare_digest(expected, signature):
+        logging.warning(f"Webhook for {name} rejected: invalid signature")
+        return jsonify({'error': 'Invalid signature'}), 401
+    if event == 'ping':
+        return jsonify({'status': 'pong'})
+    # Deactivated repos are not deployed, as in polling
+    if not repo.get('active', False):
+        return jsonify({'status': 'ignored', 'reason': 'inactive'}), 202
+    branch = repo.get('branch', 'main')
+    sha = payload.get('after', '')
+    if event != 'push' or payload.get('ref') != f'refs/heads/{branch}' or not sha.strip('0'):
+        return jsonify({'status': 'ignored'}), 202
+    if sha == repo.get('last_commit'):
+        return jsonify({'status': 'ignored', 'commit': sha}), 202
+
+    # last_commit is only written by run_command once the deploy has run, so a
+    # restart or failed deploy leaves the commit for polling to retry. A poll
+    # that sees it while the webhook deploy is in flight is coalesced into it.
+    pushed_at = (payload.get('repository') or {}).get('pushed_at')
+    sched.add_job(runner.deploy_commit, args=[repo['name'], sha, received_at, pushed_at],
+                  id=f"webhook_{repo['name']}_{sha}", replace_existing=True)
+    commands = [c['id'] for c in cfg.get('commands', []) if c.get('active') and c.get('repo') == repo['name']]
+    return jsonify({'status': 'queued', 'commit': sha, 'commands': commands}), 202
+
+# Run history
+@app.route('/api/runs', methods=['GET'])
+@require_token
+def get_runs():
+    """Run history, newest first; filter by command, server, commit (prefix) and since, page with before."""
+    args = request.args
+    return jsonify(state_store.run_history(
+        command_id=args.get('command'), server=args.get('server'), commit=args.get('commit'),
+        since=args.get('since'), before=args.get('before', type=int),
+        limit=min(args.get('limit', 50, type=int), 1000)))
 
 # Log viewing
+LOGS = {'activity': ACTIVITY_LOG, 'connectivity': CONN_LOG}
+
 def tail_lines(filepath, lines=10):
-    if not os.path.exists(filepath): return []
-    with open(filepath, 'r') as f: data=f.readlines()
-    return data[-lines:]
+    # Reads backwards from the end in blocks, so the cost does not grow with the log
+    return log_reader.tail(filepath, lines)['lines']
 
 @app.route('/logs/activity', methods=['GET'])
 def view_activity():
@@ -326,42 +464,104 @@ def view_activity():
 def view_connectivity():
     return '<br>'.join(tail_lines(CONN_LOG)) or 'No connectivity logs'
 
+@app.route('/api/logs/query', methods=['GET'])
+@require_token
+def query_logs():
+    """
+    Indexed log search, newest first: log (activity or connectivity), repo,
+    command, server, commit (prefix), level, since / until (ISO), limit;
+    page with before=<id of the last record seen>.
+    """
+    args = request.args
+    name = args.get('log', 'activity')
+    if name not in LOGS:
+        return jsonify({'error': f'Unknown log {name}'}), 404
+    return jsonify(log_index.query(
+        name, LOGS[name], repo=args.get('repo'), command=args.get('command'), server=args.get('server'),
+        commit=args.get('commit'), level=args.get('level', type=str.upper), since=args.get('since'),
+        until=args.get('until'), before=args.get('before', type=int),
+        limit=min(args.get('limit', 100, type=int), log_index.MAX_RESULTS)))
+
+def index_logs():
+    for name, path in LOGS.items():
+        log_index.refresh(name, path)
+
+@app.route('/api/logs/<name>', methods=['GET'])
+@require_token
+def get_log(name):
+    """
+    Last lines of a log (through its rotated files), oldest first. Page back
+    with before=<'before' of the previous page>; since=<'since' of an earlier
+    response> returns only the lines written after it.
+    """
+    if name not in LOGS:
+        return jsonify({'error': f'Unknown log {name}'}), 404
+    args = request.args
+    lines = min(args.get('lines', 100, type=int), log_reader.MAX_LINES)
+    try:
+        if args.get('since'):
+            return jsonify(log_reader.since(LOGS[name], args['since'], lines))
+        return jsonify(log_reader.tail(LOGS[name], lines, args.get('before')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 # Health endpoint
 @app.route('/health')
 def health():
     return jsonify({'status':'ok', 'time': datetime.utcnow().isoformat()})
 
+# Prometheus scrape endpoint; scrapers can send the API token as a bearer token
+@app.route('/metrics')
+@require_token
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # Schedule API
 @app.route('/api/schedule', methods=['GET'])
 def get_schedule():
-    jr = sched.get_job('repo_check')
-    js = sched.get_job('server_check')
+    runs = poller.next_runs()
     return jsonify({
-        'next_repo': jr.next_run_time.isoformat() if jr and jr.next_run_time else None,
-        'next_server': js.next_run_time.isoformat() if js and js.next_run_time else None
+        'next_repo': next((r['next_run'] for r in runs if r['kind'] == 'repo'), None),
+        'next_server': next((r['next_run'] for r in runs if r['kind'] == 'server'), None),
+        'items': runs
     })
 
 # Settings API
 @app.route('/api/settings', methods=['GET'])
 @require_token
 def get_settings():
-    cfg = load_config()
+    cfg = config_store.load_settings()
     return jsonify({
         'repo_interval': cfg.get('repo_interval', 24),
-        'server_interval': cfg.get('server_interval', 12)
+        'server_interval': cfg.get('server_interval', 12),
+        'poll_workers': cfg.get('poll_workers', runner.DEFAULT_POLL_WORKERS),
+        'poll_timeout': cfg.get('poll_timeout', runner.DEFAULT_POLL_TIMEOUT),
+        'poll_mode': cfg.get('poll_mode', runner.DEFAULT_POLL_MODE),
+        'deploy_workers': cfg.get('deploy_workers', runner.DEFAULT_DEPLOY_WORKERS),
+        'deploy_debounce': cfg.get('deploy_debounce', runner.DEFAULT_DEPLOY_DEBOUNCE),
+        'probe_workers': cfg.get('probe_workers', runner.DEFAULT_PROBE_WORKERS),
+        'auth_probe_interval': cfg.get('auth_probe_interval', runner.DEFAULT_AUTH_PROBE_INTERVAL),
+        'poll_budget': runner.poll_budget(),
+        'secrets_cache': secrets_manager.cache_stats()
     })
 
 @app.route('/api/settings', methods=['POST'])
 @require_token
 def update_settings():
     data = request.json or {}
-    cfg = load_config()
-    cfg['repo_interval'] = data.get('repo_interval', cfg.get('repo_interval', 24))
-    cfg['server_interval'] = data.get('server_interval', cfg.get('server_interval', 12))
-    save_config(cfg)
-    # Reschedule jobs
-    sched.reschedule_job('repo_check', trigger='interval', hours=cfg['repo_interval'])
-    sched.reschedule_job('server_check', trigger='interval', hours=cfg['server_interval'])
+    # Read-modify-write under the config lock so concurrent updates are not lost
+    with config_store.transaction() as cfg:
+        cfg['repo_interval'] = data.get('repo_interval', cfg.get('repo_interval', 24))
+        cfg['server_interval'] = data.get('server_interval', cfg.get('server_interval', 12))
+        cfg['poll_workers'] = data.get('poll_workers', cfg.get('poll_workers', runner.DEFAULT_POLL_WORKERS))
+        cfg['poll_timeout'] = data.get('poll_timeout', cfg.get('poll_timeout', runner.DEFAULT_POLL_TIMEOUT))
+        cfg['poll_mode'] = data.get('poll_mode', cfg.get('poll_mode', runner.DEFAULT_POLL_MODE))
+        cfg['deploy_workers'] = data.get('deploy_workers', cfg.get('deploy_workers', runner.DEFAULT_DEPLOY_WORKERS))
+        cfg['deploy_debounce'] = data.get('deploy_debounce', cfg.get('deploy_debounce', runner.DEFAULT_DEPLOY_DEBOUNCE))
+        cfg['probe_workers'] = data.get('probe_workers', cfg.get('probe_workers', runner.DEFAULT_PROBE_WORKERS))
+        cfg['auth_probe_interval'] = data.get('auth_probe_interval', cfg.get('auth_probe_interval', runner.DEFAULT_AUTH_PROBE_INTERVAL))
+    # Items without their own interval pick up the new defaults
+    poller.sync()
     return jsonify({'status':'ok'})
 
 
@@ -400,13 +600,18 @@ def get_ip_on_ts_net_domain():
 
 
 
-# Scheduler setup with configurable intervals
-cfg = load_config()
-repo_interval = cfg.get('repo_interval', 24)
-server_interval = cfg.get('server_interval', 12)
+# Scheduler setup: one tick job drives the per-repo / per-server due-time heap
+# Manual triggers and command runs execute here, off the request thread
+job_queue = jobs.JobQueue(config_store.load_settings().get('job_workers', jobs.DEFAULT_JOB_WORKERS))
+metrics.Gauge('rpr_job_queue_depth', 'Background jobs by state', ('state',), fn=job_queue.depth)
+poller = poll_scheduler.PollScheduler(config_store.load_config, {'repo': runner.check_repos,
+                                                    'server': runner.check_servers})
+poller.sync()
 sched = BackgroundScheduler()
-sched.add_job(runner.check_repos, 'interval', hours=repo_interval, id='repo_check')
-sched.add_job(runner.check_servers, 'interval', hours=server_interval, id='server_check')
+sched.add_job(poller.tick, 'interval', seconds=poll_scheduler.TICK_SECONDS, id='poll_tick')
+sched.add_job(index_logs, 'interval', seconds=LOG_INDEX_INTERVAL, id='log_index')
+# Idle or broken SSH transports are closed even when no command uses the pool for hours
+sched.add_job(ssh_pool.evict_idle, 'interval', seconds=ssh_pool.IDLE_SECONDS, id='ssh_evict_idle')
 sched.start()
 
 if __name__ == '__main__':
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 import argparse
 from datetime import datetime
-from github import Github
+import github_client
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Simple CI check script")
@@ -12,9 +12,10 @@ def parse_args():
 
 def main():
     args = parse_args()
-    g = Github(args.token) if args.token else Github()
-    repo = g.get_repo(args.repo)
-    last_commit = repo.get_commits()[0].commit.committer.date
+    commits, _ = github_client.get_json(f"/repos/{args.repo}/commits?per_page=1", args.token)
+    committed = commits[0]['commit']['committer']['date'].replace('Z', '+00:00')
+    last_commit = datetime.fromisoformat(committed).replace(tzinfo=None)
+    github_client.save_cache()
     last_check_time = datetime.fromisoformat(args.last_check)
     if last_commit > last_check_time:
         print(f"New commit detected: {last_commit.isoformat()}")
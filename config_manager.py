@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 import argparse
-import json
 import os
 import uuid
 import re
+import git_mirror
 import secrets_manager
+import state_store
 
 
 def normalize_repo_url(repo):
@@ -12,21 +13,6 @@ def normalize_repo_url(repo):
     return m.group(1) if m else repo
 
 
-CONFIG_FILE = 'config.json'
-
-
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
-    return {'repos': [], 'servers': [], 'commands': []}
-
-
-def save_config(cfg):
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(cfg, f, indent=2)
-
-
 def sanitize_input(val):
     if '<script>' in val.lower():
         print("Invalid input: script tags are not allowed")
@@ -39,12 +25,12 @@ def add_repo(args):
         sanitize_input(args.branch)
     if args.token:
         sanitize_input(args.token)
-    cfg = load_config()
+    if args.webhook_secret:
+        sanitize_input(args.webhook_secret)
     repo_name = normalize_repo_url(args.repo)
-    for r in cfg['repos']:
-        if r['name'] == repo_name:
-            print(f"Repository {repo_name} already enrolled.")
-            return
+    if state_store.get('repos', repo_name):
+        print(f"Repository {repo_name} already enrolled.")
+        return
     entry = {
         'name': repo_name,
         'branch': args.branch or 'main',
@@ -53,41 +39,47 @@ def add_repo(args):
         'last_commit': '',
         'secrets': []
     }
+    if args.interval:
+        entry['interval'] = args.interval
+    if args.fetch:
+        entry['fetch'] = args.fetch
+    if args.depth:
+        entry['fetch_depth'] = args.depth
+    if args.reference:
+        entry['reference'] = args.reference
+    if args.debounce:
+        entry['deploy_debounce'] = args.debounce
     if args.token:
         secret_id = secrets_manager.store_secret(f"{repo_name}_token", args.token)
         entry['secrets'].append({'key': 'token', 'id': secret_id})
-    cfg['repos'].append(entry)
-    save_config(cfg)
+    if args.webhook_secret:
+        secret_id = secrets_manager.store_secret(f"{repo_name}_webhook_secret", args.webhook_secret)
+        entry['secrets'].append({'key': 'webhook_secret', 'id': secret_id})
+    state_store.put('repos', entry)
     print(f"Enrolled repository {repo_name}")
 
 
 def list_repos(args):
-    cfg = load_config()
-    if not cfg['repos']:
+    repos = state_store.items('repos')
+    if not repos:
         print("No repositories enrolled.")
         return
-    for r in cfg['repos']:
+    for r in repos:
         status = 'active' if r.get('active') else 'inactive'
         print(f"{r['name']} (branch={r.get('branch')}, status={status}, last_check={r.get('last_check')})")
 
 
 def remove_repo(args):
-    cfg = load_config()
-    original = len(cfg['repos'])
-    cfg['repos'] = [r for r in cfg['repos'] if r['name'] != args.repo]
-    if len(cfg['repos']) < original:
-        save_config(cfg)
+    if state_store.delete('repos', args.repo):
         print(f"Removed repository {args.repo}")
     else:
         print(f"No repository named {args.repo} found.")
 
 
 def add_server(args):
-    cfg = load_config()
-    for s in cfg['servers']:
-        if s['host'] == args.host:
-            print(f"Server {args.host} already enrolled.")
-            return
+    if state_store.get('servers', args.host):
+        print(f"Server {args.host} already enrolled.")
+        return
     entry = {
         'host': args.host,
         'user': args.user,
@@ -95,34 +87,30 @@ def add_server(args):
         'active': True,
         'last_check': '1970-01-01T00:00:00'
     }
-    cfg['servers'].append(entry)
-    save_config(cfg)
+    if args.interval:
+        entry['interval'] = args.interval
+    state_store.put('servers', entry)
     print(f"Enrolled server {args.host}")
 
 
 def list_servers(args):
-    cfg = load_config()
-    if not cfg['servers']:
+    servers = state_store.items('servers')
+    if not servers:
         print("No servers enrolled.")
         return
-    for s in cfg['servers']:
+    for s in servers:
         status = 'active' if s.get('active') else 'inactive'
         print(f"{s['host']} (user={s.get('user')}, status={status}, last_check={s.get('last_check')})")
 
 
 def remove_server(args):
-    cfg = load_config()
-    original = len(cfg['servers'])
-    cfg['servers'] = [s for s in cfg['servers'] if s['host'] != args.host]
-    if len(cfg['servers']) < original:
-        save_config(cfg)
+    if state_store.delete('servers', args.host):
         print(f"Removed server {args.host}")
     else:
         print(f"No server with host {args.host} found.")
 
 
 def add_command(args):
-    cfg = load_config()
     cmd_id = uuid.uuid4().hex
     entry = {
         'id': cmd_id,
@@ -133,16 +121,12 @@ def add_command(args):
         'last_run': '1970-01-01T00:00:00',
         'secrets': []  # new field for command secrets
     }
-    cfg.setdefault('commands', [])
-    cfg['commands'] = [c for c in cfg['commands'] if c['id'] != cmd_id]
-    cfg['commands'].append(entry)
-    save_config(cfg)
+    state_store.put('commands', entry)
     print(f"Enrolled command {cmd_id}")
 
 
 def list_commands(args):
-    cfg = load_config()
-    cmds = cfg.get('commands', [])
+    cmds = state_store.items('commands')
     if not cmds:
         print("No commands enrolled.")
         return
@@ -152,66 +136,62 @@ def list_commands(args):
 
 
 def remove_command(args):
-    cfg = load_config()
-    original = len(cfg.get('commands', []))
-    cfg['commands'] = [c for c in cfg.get('commands', []) if c['id'] != args.id]
-    if len(cfg['commands']) < original:
-        save_config(cfg)
+    if state_store.delete('commands', args.id):
         print(f"Removed command {args.id}")
     else:
         print(f"No command with id {args.id} found.")
 
 
 def add_secret(args):
-    cfg = load_config()
-    for c in cfg.get('commands', []):
-        if c['id'] == args.id:
-            secret_id = secrets_manager.store_secret(args.key, args.value)
-            sec = c.setdefault('secrets', [])
-            sec.append({'key': args.key, 'id': secret_id})
-            save_config(cfg)
-            print(f"Added secret {args.key} (id={secret_id}) to command {args.id}")
-            return
-    print(f"No command with id {args.id} found.")
+    if not state_store.get('commands', args.id):
+        print(f"No command with id {args.id} found.")
+        return
+    secret_id = secrets_manager.store_secret(args.key, args.value)
+    state_store.update('commands', args.id,
+                       fn=lambda c: c.setdefault('secrets', []).append({'key': args.key, 'id': secret_id}))
+    print(f"Added secret {args.key} (id={secret_id}) to command {args.id}")
 
 
 def list_secrets(args):
-    cfg = load_config()
-    for c in cfg.get('commands', []):
-        if c['id'] == args.id:
-            secrets = c.get('secrets', [])
-            if not secrets:
-                print("No secrets set for this command.")
-                return
-            for s in secrets:
-                val = secrets_manager.get_secret(s['id'])
-                masked = secrets_manager.mask_secret(val)
-                print(f"{s['key']} = {masked} (id={s['id']})")
-            return
-    print(f"No command with id {args.id} found.")
+    c = state_store.get('commands', args.id)
+    if not c:
+        print(f"No command with id {args.id} found.")
+        return
+    secrets = c.get('secrets', [])
+    if not secrets:
+        print("No secrets set for this command.")
+        return
+    values = secrets_manager.get_secrets([s['id'] for s in secrets])
+    for s in secrets:
+        masked = secrets_manager.mask_secret(values[s['id']]) if s['id'] in values else None
+        print(f"{s['key']} = {masked} (id={s['id']})")
 
 
 def remove_secret(args):
-    cfg = load_config()
-    for c in cfg.get('commands', []):
-        if c['id'] == args.id:
-            secrets = c.get('secrets', [])
-            new_list = []
-            removed = False
-            for s in secrets:
-                if s['key'] == args.key:
-                    secrets_manager.delete_secret(s['id'])
-                    removed = True
-                else:
-                    new_list.append(s)
-            if removed:
-                c['secrets'] = new_list
-                save_config(cfg)
-                print(f"Removed secret {args.key} from command {args.id}")
-            else:
-                print(f"No secret with key {args.key} found for command {args.id}")
-            return
-    print(f"No command with id {args.id} found.")
+    c = state_store.get('commands', args.id)
+    if not c:
+        print(f"No command with id {args.id} found.")
+        return
+    removed = [s for s in c.get('secrets', []) if s['key'] == args.key]
+    if not removed:
+        print(f"No secret with key {args.key} found for command {args.id}")
+        return
+    state_store.update('commands', args.id,
+                       fn=lambda c: c.update(secrets=[s for s in c.get('secrets', []) if s['key'] != args.key]))
+    for s in removed:
+        secrets_manager.delete_secret(s['id'])
+    print(f"Removed secret {args.key} from command {args.id}")
+
+
+def list_runs(args):
+    runs = state_store.run_history(command_id=args.id, server=args.server, commit=args.commit, limit=args.limit)
+    if not runs:
+        print("No runs recorded.")
+        return
+    for r in runs:
+        print(f"{r['started']} {r['command_id']} server:{r['server']} commit:{(r['commit_sha'] or '')[:12]} "
+              f"status:{r['status']} exit:{r['exit_status']} ({r['seconds']}s)"
+              + (f" coalesced:{r['coalesced']} skipped:{r['skipped']}" if r['coalesced'] or r['skipped'] else ''))
 
 
 def main():
@@ -222,6 +202,14 @@ def main():
     parser_add.add_argument('--repo', required=True, help='GitHub repo full name (user/repo)')
     parser_add.add_argument('--token', help='GitHub personal access token')
     parser_add.add_argument('--branch', default='main', help='Branch to monitor')
+    parser_add.add_argument('--interval', type=int, help='Poll interval in minutes (default: repo_interval)')
+    parser_add.add_argument('--webhook-secret', help='Secret used to sign GitHub push webhooks')
+    parser_add.add_argument('--fetch', choices=git_mirror.FETCH_STRATEGIES,
+                            help='How servers clone and update the repo (default: full)')
+    parser_add.add_argument('--depth', type=int, help='History depth for --fetch shallow (default: 1)')
+    parser_add.add_argument('--reference', help='Repo on the servers whose objects are reused via alternates')
+    parser_add.add_argument('--debounce', type=float,
+                            help='Seconds to wait before deploying a new commit (default: deploy_debounce)')
     parser_add.set_defaults(func=add_repo)
 
     parser_list = subs.add_parser('list-repos', help='List enrolled repositories')
@@ -235,6 +223,7 @@ def main():
     parser_add.add_argument('--host', required=True, help='Server host or IP')
     parser_add.add_argument('--user', default=os.getlogin(), help='SSH username')
     parser_add.add_argument('--key', default=os.path.expanduser('~/.ssh/id_rsa'), help='Path to SSH private key')
+    parser_add.add_argument('--interval', type=int, help='Check interval in minutes (default: server_interval)')
     parser_add.set_defaults(func=add_server)
 
     parser_list = subs.add_parser('list-servers', help='List enrolled servers')
@@ -272,6 +261,13 @@ def main():
     parser_sec_remove.add_argument('--key', required=True, help='Secret key name')
     parser_sec_remove.set_defaults(func=remove_secret)
 
+    parser_runs = subs.add_parser('list-runs', help='Show run history, newest first')
+    parser_runs.add_argument('--id', help='Only runs of this command ID')
+    parser_runs.add_argument('--server', help='Only runs on this server')
+    parser_runs.add_argument('--commit', help='Only runs of commits starting with this SHA')
+    parser_runs.add_argument('--limit', type=int, default=20, help='Number of runs to show')
+    parser_runs.set_defaults(func=list_runs)
+
     args = parser.parse_args()
     if not args.command:
         parser.print_help()
@@ -0,0 +1,104 @@
+import copy
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import state_store
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CONFIG_FILE = 'config.json'
+
+_lock = threading.RLock()
+_cache = {'stamp': None, 'settings': {}}
+
+
+def file_stamp(path):
+    """Identifies a file's current version; None when it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on <path>.lock, held across processes (the CLI, the app, cron runs)."""
+    with open(f"{path}.lock", 'a+') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write_json(path, data, mode=None):
+    """Write JSON to a temp file and rename it over path, so a crash never leaves a truncated file."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    if mode is not None:
+        os.chmod(tmp, mode)
+    os.replace(tmp, path)
+
+
+def _read():
+    # Re-parse only when the file changed since the last read or write
+    stamp = file_stamp(CONFIG_FILE)
+    if stamp != _cache['stamp']:
+        settings = {}
+        if stamp is not None:
+            with open(CONFIG_FILE, 'r') as f:
+                settings = json.load(f)
+        _cache.update(stamp=stamp, settings=settings)
+    return _cache['settings']
+
+
+def _write(settings):
+    atomic_write_json(CONFIG_FILE, settings)
+    _cache.update(stamp=file_stamp(CONFIG_FILE), settings=copy.deepcopy(settings))
+
+
+def load_settings():
+    """Settings from config.json (a copy; the parsed file is cached until it changes)."""
+    with _lock:
+        return copy.deepcopy(_read())
+
+
+@contextmanager
+def transaction():
+    """
+    Read-modify-write the settings under a lock held across threads and
+    processes. The yielded dict is written back if it was changed.
+    """
+    with _lock, file_lock(CONFIG_FILE):
+        # Another process may have written since our cached read
+        _cache['stamp'] = None
+        before = _read()
+        settings = copy.deepcopy(before)
+        yield settings
+        if settings != before:
+            _write(settings)
+
+
+def load_config():
+    """Settings plus the repos, servers and commands from the state store, as one dict."""
+    cfg = load_settings()
+    cfg.update(state_store.snapshot())
+    return cfg
@@ -0,0 +1,115 @@
+import base64
+import logging
+import os
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger('runner')
+
+# How run_command brings a repo to the deployed commit ('fetch' on each repo); 'mirror' uses this module.
+# Kept here, free of start-up side effects, so the CLI can import it too.
+FETCH_STRATEGIES = ('full', 'single-branch', 'shallow', 'blobless', 'treeless', 'sha', 'mirror')
+MIRROR_DIR = 'mirrors'
+BUNDLE_DIR = os.path.join(MIRROR_DIR, 'bundles')
+# Bundles are reused by every server deployed from the same previous commit
+BUNDLE_RETENTION_SECONDS = 86400
+# Ref that bundles carry; servers fetch it and check out the SHA
+DEPLOY_REF = 'refs/rpr/deploy'
+REMOTE_URL = 'https://github.com/{repo}.git'
+# Branches only: a --mirror clone would also fetch every pull request head (refs/pull/*)
+FETCH_REFSPEC = '+refs/heads/*:refs/heads/*'
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _lock(repo_name):
+    with _locks_lock:
+        return _locks.setdefault(repo_name, threading.Lock())
+
+
+def mirror_path(repo_name):
+    return os.path.join(MIRROR_DIR, repo_name.replace('/', '_') + '.git')
+
+
+def _git(args, cwd=None, token=None):
+    env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+    if token:
+        # Passed through the environment so the token is neither on the command line nor in the mirror's config
+        basic = base64.b64encode(f"x-access-token:{token}".encode()).decode()
+        env.update(GIT_CONFIG_COUNT='1', GIT_CONFIG_KEY_0='http.extraheader',
+                   GIT_CONFIG_VALUE_0=f"Authorization: Basic {basic}")
+    result = subprocess.run(['git', *args], cwd=cwd, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"git {args[0]} failed: {result.stderr.strip()}")
+    return result.stdout.strip()
+
+
+def _has_commit(path, sha):
+    return subprocess.run(['git', 'cat-file', '-e', f'{sha}^{{commit}}'], cwd=path,
+                          capture_output=True).returncode == 0
+
+
+def update(repo_name, sha, token=None):
+    """
+    Make sure the runner's bare mirror of a repo (branches only) contains sha,
+    cloning it the first time. Concurrent deploys of one commit share a single
+    fetch: the first one fetches, the others find the commit already there.
+    Returns the mirror path.
+    """
+    path = mirror_path(repo_name)
+    url = REMOTE_URL.format(repo=repo_name)
+    with _lock(repo_name):
+        if not os.path.isdir(path):
+            os.makedirs(MIRROR_DIR, exist_ok=True)
+            started = time.monotonic()
+            _git(['clone', '--bare', '--quiet', url, path], token=token)
+            logger.info(f"[MIRROR] Cloned {repo_name} in {time.monotonic() - started:.1f}s")
+        if not _has_commit(path, sha):
+            started = time.monotonic()
+            # Bare clones have no fetch refspec; this also narrows mirrors made with --mirror
+            _git(['config', '--replace-all', 'remote.origin.fetch', FETCH_REFSPEC], cwd=path)
+            _git(['fetch', '--prune', '--quiet', 'origin'], cwd=path, token=token)
+            if not _has_commit(path, sha):
+                # Not on any branch any more (force push): ask for the commit itself
+                _git(['fetch', '--quiet', 'origin', sha], cwd=path, token=token)
+            logger.info(f"[MIRROR] Fetched {repo_name} up to {sha} in {time.monotonic() - started:.1f}s")
+    return path
+
+
+def _prune_bundles():
+    cutoff = time.time() - BUNDLE_RETENTION_SECONDS
+    for name in os.listdir(BUNDLE_DIR):
+        path = os.path.join(BUNDLE_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def bundle(repo_name, sha, have=None):
+    """
+    Bundle with the objects needed to go from commit `have` (what a server has
+    checked out, None for a new server) to sha. Returns None when the server
+    already has every object (sha is an ancestor of have).
+    """
+    path = mirror_path(repo_name)
+    with _lock(repo_name):
+        if have and not _has_commit(path, have):
+            have = None
+        if have and subprocess.run(['git', 'merge-base', '--is-ancestor', sha, have], cwd=path,
+                                   capture_output=True).returncode == 0:
+            return None
+        os.makedirs(BUNDLE_DIR, exist_ok=True)
+        _prune_bundles()
+        name = f"{repo_name.replace('/', '_')}-{sha[:12]}-{have[:12] if have else 'full'}.bundle"
+        out = os.path.join(BUNDLE_DIR, name)
+        if not os.path.exists(out):
+            _git(['update-ref', DEPLOY_REF, sha], cwd=path)
+            tmp = f"{out}.{threading.get_ident()}.tmp"
+            _git(['bundle', 'create', '--quiet', os.path.abspath(tmp), DEPLOY_REF]
+                 + ([f'^{have}'] if have else []), cwd=path)
+            os.replace(tmp, out)
+        return out
@@ -0,0 +1,255 @@
+import os
+import json
+import hashlib
+import threading
+import time
+from urllib.parse import quote
+import requests
+from requests.adapters import HTTPAdapter
+import secrets_manager
+import metrics
+
+API_URL = 'https://api.github.com'
+GRAPHQL_URL = f'{API_URL}/graphql'
+# Repositories resolved per GraphQL query in batch mode
+GRAPHQL_BATCH_SIZE = 50
+# Keep-alive connections held per pooled client
+POOL_MAXSIZE = 32
+# Persistent conditional-request cache (ETag / Last-Modified per URL and token)
+CACHE_FILE = 'github_cache.json'
+# Seconds a decrypted repo token is kept before it is decrypted again
+TOKEN_CACHE_TTL = 900
+
+_cache = None
+_cache_dirty = False
+_cache_lock = threading.Lock()
+
+# Process-wide pool of keep-alive sessions keyed by token fingerprint,
+# plus decrypted repo tokens keyed by secret id: (record version, token, expires)
+_clients = {}
+_secret_tokens = {}
+_clients_lock = threading.Lock()
+
+# Latest X-RateLimit-* values seen, keyed by (token fingerprint, resource)
+_rate_limits = {}
+
+# HTTP requests issued since start-up (used for per-sweep accounting)
+_request_count = 0
+_count_lock = threading.Lock()
+
+
+def token_fingerprint(token):
+    """Stable, non-reversible identifier for a token (never store the token itself)."""
+    if not token:
+        return 'anonymous'
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+def _count_request():
+    global _request_count
+    with _count_lock:
+        _request_count += 1
+
+
+def request_count():
+    """Total number of GitHub HTTP requests issued by this process."""
+    return _request_count
+
+
+def _record_rate_limit(token, resp):
+    headers = resp.headers
+    if 'X-RateLimit-Remaining' not in headers:
+        return
+    resource = headers.get('X-RateLimit-Resource', 'core')
+    _rate_limits[(token_fingerprint(token), resource)] = {
+        'limit': int(headers.get('X-RateLimit-Limit', 0)),
+        'remaining': int(headers['X-RateLimit-Remaining']),
+        'reset': int(headers.get('X-RateLimit-Reset', 0)),
+    }
+
+
+# Quota left per token, read when /metrics is scraped
+metrics.Gauge('rpr_github_rate_limit_remaining', 'GitHub requests left before the rate limit resets',
+              ('token', 'resource'), fn=lambda: {key: v['remaining'] for key, v in list(_rate_limits.items())})
+
+
+def rate_limit(fingerprint, resource='core'):
+    """Last known quota for a token fingerprint ({'limit', 'remaining', 'reset'}) or None."""
+    return _rate_limits.get((fingerprint, resource))
+
+
+def _auth_headers(token):
+    headers = {'Accept': 'application/vnd.github+json'}
+    if token:
+        headers['Authorization'] = f'token {token}'
+    return headers
+
+
+def get_client(token=None):
+    """Return the shared keep-alive session for a token, creating it on first use."""
+    fingerprint = token_fingerprint(token)
+    with _clients_lock:
+        session = _clients.get(fingerprint)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=POOL_MAXSIZE))
+            session.headers.update(_auth_headers(token))
+            _clients[fingerprint] = session
+    return session
+
+
+def close_client(token):
+    """Drop the pooled session for a token and close its connections."""
+    with _clients_lock:
+        session = _clients.pop(token_fingerprint(token), None)
+    if session is not None:
+        session.close()
+
+
+def prune_clients(secret_ids):
+    """
+    Forget tokens for secrets that are no longer referenced and close the
+    pooled sessions that only those tokens were using. Expired tokens are
+    dropped too, but the sessions of referenced secrets are kept.
+    """
+    now = time.monotonic()
+    with _clients_lock:
+        for secret_id in [sid for sid in _secret_tokens if sid not in secret_ids]:
+            del _secret_tokens[secret_id]
+        keep = {token_fingerprint(t) for _, t, _ in _secret_tokens.values()} | {'anonymous'}
+        sessions = [_clients.pop(fp) for fp in list(_clients) if fp not in keep]
+        for secret_id in [sid for sid, (_, _, expires) in _secret_tokens.items() if expires <= now]:
+            del _secret_tokens[secret_id]
+    for session in sessions:
+        session.close()
+
+
+def token_for_secret(secret_id):
+    """
+    Return the decrypted token for a secret id, decrypting only when the stored
+    record changed or TOKEN_CACHE_TTL passed since the last decryption. Raises
+    KeyError if the secret was deleted, in which case its pooled session is closed as well.
+    """
+    try:
+        version = secrets_manager.secret_version(secret_id)
+    except KeyError:
+        with _clients_lock:
+            cached = _secret_tokens.pop(secret_id, None)
+        if cached:
+            close_client(cached[1])
+        raise
+    with _clients_lock:
+        cached = _secret_tokens.get(secret_id)
+    if cached and cached[0] == version and cached[2] > time.monotonic():
+        return cached[1]
+    token = secrets_manager.get_secret(secret_id)
+    with _clients_lock:
+        _secret_tokens[secret_id] = (version, token, time.monotonic() + TOKEN_CACHE_TTL)
+    if cached and cached[1] != token:
+        close_client(cached[1])
+    return token
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        _cache = {}
+        if os.path.exists(CACHE_FILE):
+            try:
+                with open(CACHE_FILE, 'r') as f:
+                    _cache = json.load(f)
+            except (OSError, ValueError):
+                _cache = {}
+    return _cache
+
+
+def save_cache():
+    """Write the response cache to disk if it changed since the last save."""
+    global _cache_dirty
+    with _cache_lock:
+        if not _cache_dirty:
+            return
+        tmp = f"{CACHE_FILE}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(_cache, f)
+        os.replace(tmp, CACHE_FILE)
+        _cache_dirty = False
+
+
+def get_json(path, token=None, timeout=30):
+    """
+    GET an API path, revalidating any cached copy with If-None-Match /
+    If-Modified-Since. A 304 answer does not count against the rate limit.
+    Returns (data, changed) where changed is False when served from cache.
+    """
+    global _cache_dirty
+    url = f"{API_URL}{path}"
+    key = f"{token_fingerprint(token)} {url}"
+    headers = {}
+    with _cache_lock:
+        entry = _load_cache().get(key)
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    _count_request()
+    with metrics.GITHUB_REQUEST_SECONDS.time('rest'):
+        resp = get_client(token).get(url, headers=headers, timeout=timeout)
+    _record_rate_limit(token, resp)
+    if resp.status_code == 304 and entry:
+        return entry['data'], False
+    resp.raise_for_status()
+    data = resp.json()
+
+    etag = resp.headers.get('ETag')
+    last_modified = resp.headers.get('Last-Modified')
+    if etag or last_modified:
+        with _cache_lock:
+            _load_cache()[key] = {'etag': etag, 'last_modified': last_modified, 'data': data}
+            _cache_dirty = True
+    return data, True
+
+
+def branch_head(repo_name, branch, token=None, timeout=30):
+    """Return the SHA the branch ref currently points at."""
+    data, _ = get_json(f"/repos/{repo_name}/git/ref/heads/{quote(branch)}", token, timeout)
+    return data['object']['sha']
+
+
+def graphql(query, variables, token, timeout=30):
+    """Run a GraphQL query (requires a token). Returns (data, errors)."""
+    _count_request()
+    with metrics.GITHUB_REQUEST_SECONDS.time('graphql'):
+        resp = get_client(token).post(GRAPHQL_URL, json={'query': query, 'variables': variables},
+                                      timeout=timeout)
+    _record_rate_limit(token, resp)
+    resp.raise_for_status()
+    body = resp.json()
+    return body.get('data') or {}, body.get('errors') or []
+
+
+def branch_heads(repo_branches, token, timeout=30):
+    """
+    Resolve the head SHA of many (repo_name, branch) pairs sharing one token
+    with a single GraphQL query. Returns {repo_name: sha} for the pairs that
+    resolved; missing repos, branches or permissions are simply left out.
+    """
+    params, fields, variables = [], [], {}
+    for i, (repo_name, branch) in enumerate(repo_branches):
+        owner, _, name = repo_name.partition('/')
+        params.append(f'$o{i}: String!, $n{i}: String!, $b{i}: String!')
+        fields.append(f'r{i}: repository(owner: $o{i}, name: $n{i}) '
+                      f'{{ ref(qualifiedName: $b{i}) {{ target {{ oid }} }} }}')
+        variables.update({f'o{i}': owner, f'n{i}': name, f'b{i}': f'refs/heads/{branch}'})
+    query = f"query({', '.join(params)}) {{ {' '.join(fields)} }}"
+    data, _ = graphql(query, variables, token, timeout)
+
+    heads = {}
+    for i, (repo_name, _) in enumerate(repo_branches):
+        repo = data.get(f'r{i}') or {}
+        target = (repo.get('ref') or {}).get('target') or {}
+        if target.get('oid'):
+            heads[repo_name] = target['oid']
+    return heads
@@ -0,0 +1,93 @@
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger('runner')
+
+DEFAULT_JOB_WORKERS = 4
+# Finished jobs kept for the status API
+KEEP_FINISHED = 200
+
+
+class JobQueue:
+    """
+    Runs manual triggers on a worker pool so HTTP requests return straight away.
+    Jobs are keyed by what they do; submitting a key that is already queued
+    (or running, for jobs submitted with join_running) returns that job
+    instead of adding another.
+    """
+
+    def __init__(self, workers=DEFAULT_JOB_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._jobs = {}     # job id -> job dict, in submission order
+        self._pending = {}  # key -> job id of the queued or running job
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, join_running=False):
+        """Queue fn(*args) under `key`; returns (job, coalesced)."""
+        with self._lock:
+            job = self._jobs.get(self._pending.get(key))
+            if job and (job['state'] == 'queued' or join_running):
+                job['coalesced'] += 1
+                return dict(job), True
+            job = {
+                'id': uuid.uuid4().hex[:12],
+                'kind': key[0],
+                'target': key[1] if len(key) > 1 else None,
+                'state': 'queued',
+                'coalesced': 0,
+                'created': datetime.utcnow().isoformat(),
+                'started': None,
+                'finished': None,
+                'seconds': None,
+                'result': None,
+                'error': None,
+            }
+            self._jobs[job['id']] = job
+            self._pending[key] = job['id']
+            self._prune()
+        self._pool.submit(self._run, key, job, fn, args)
+        return dict(job), False
+
+    def depth(self):
+        """{('queued',): n, ('running',): n}: jobs waiting for a worker and jobs in progress."""
+        with self._lock:
+            states = [job['state'] for job in self._jobs.values()]
+        return {(state,): states.count(state) for state in ('queued', 'running')}
+
+    def _run(self, key, job, fn, args):
+        with self._lock:
+            job['state'] = 'running'
+            job['started'] = datetime.utcnow().isoformat()
+        started = datetime.utcnow()
+        try:
+            result = fn(*args)
+            state, error = 'done', None
+        except Exception as e:
+            logger.error(f"[JOB {job['id']}] {job['kind']} failed: {e}")
+            result, state, error = None, 'failed', str(e)
+        with self._lock:
+            if self._pending.get(key) == job['id']:
+                del self._pending[key]
+            job['state'] = state
+            job['result'] = result
+            job['error'] = error
+            job['finished'] = datetime.utcnow().isoformat()
+            job['seconds'] = round((datetime.utcnow() - started).total_seconds(), 3)
+
+    def _prune(self):
+        finished = [i for i, j in self._jobs.items() if j['state'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self, limit=50):
+        """Most recent jobs first."""
+        with self._lock:
+            return [dict(j) for j in reversed(list(self._jobs.values()))][:limit]
@@ -0,0 +1,248 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+import log_reader
+
+INDEX_FILE = os.path.join('logs', 'index.db')
+# Record fields that can be passed as logger extra={...}, and their index columns
+FIELDS = ('repo', 'command', 'server', 'commit', 'seconds')
+_COLUMNS = {'repo': 'repo', 'command': 'command', 'server': 'server', 'commit': 'commit_sha', 'seconds': 'seconds'}
+# Most records returned by one query
+MAX_RESULTS = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    inode INTEGER PRIMARY KEY,
+    log TEXT NOT NULL,
+    head BLOB,
+    offset INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    log TEXT NOT NULL,
+    inode INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    ts TEXT,
+    level TEXT,
+    repo TEXT,
+    command TEXT,
+    server TEXT,
+    commit_sha TEXT,
+    seconds REAL
+);
+CREATE INDEX IF NOT EXISTS entries_log ON entries (log, id);
+CREATE INDEX IF NOT EXISTS entries_ts ON entries (log, ts);
+CREATE INDEX IF NOT EXISTS entries_repo ON entries (repo, id);
+CREATE INDEX IF NOT EXISTS entries_command ON entries (command, id);
+CREATE INDEX IF NOT EXISTS entries_server ON entries (server, id);
+CREATE INDEX IF NOT EXISTS entries_commit ON entries (commit_sha, id);
+CREATE INDEX IF NOT EXISTS entries_inode ON entries (inode, id);
+"""
+_INSERT = (f"INSERT INTO entries (log, inode, offset, length, ts, level, {', '.join(_COLUMNS.values())}) "
+           f"VALUES ({', '.join('?' * (6 + len(_COLUMNS)))})")
+# Records added by one refresh after which the index statistics are updated
+ANALYZE_AFTER = 10000
+# First bytes of a file, stored to notice an inode reused by a new file
+HEAD_BYTES = 64
+
+# Text lines: '%(asctime)s %(levelname)s %(message)s'
+_TEXT = re.compile(rb'^(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}:\d{2}),(\d{3}) ([A-Z]+) (.*)')
+_COMMAND = re.compile(rb'^\[COMMAND (\w+)\]')
+_HOST = re.compile(rb'^\[([^\]\s]+)\]')
+
+_local = threading.local()
+_refresh_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg and any FIELDS given as extra."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def _connect():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.path == INDEX_FILE:
+        return conn
+    conn = sqlite3.connect(INDEX_FILE, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(_SCHEMA)
+    _local.conn, _local.path = conn, INDEX_FILE
+    return conn
+
+
+def _parse(log, line):
+    """(ts, level, {field: value}) of the first line of a record, or None for a continuation line."""
+    if line.startswith(b'{'):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        return entry.get('ts'), entry.get('level'), {f: entry.get(f) for f in FIELDS}
+    m = _TEXT.match(line)
+    if not m:
+        return None
+    day, clock, millis, level, msg = m.groups()
+    fields = dict.fromkeys(FIELDS)
+    prefix = _COMMAND.match(msg) or (_HOST.match(msg) if log == 'connectivity' else None)
+    if prefix:
+        fields['command' if prefix.re is _COMMAND else 'server'] = prefix.group(1).decode()
+    return f"{day.decode()}T{clock.decode()}.{millis.decode()}", level.decode(), fields
+
+
+def _index_file(conn, log, f):
+    """Index the complete lines appended to one file since the last refresh; returns how many records were added."""
+    inode = os.fstat(f.fileno()).st_ino
+    head = f.read(HEAD_BYTES)
+    row = conn.execute('SELECT log, head, offset FROM files WHERE inode = ?', (inode,)).fetchone()
+    offset = row['offset'] if row else 0
+    size = os.fstat(f.fileno()).st_size
+    if row and (row['log'] != log or row['head'] != head[:len(row['head'])] or size < offset):
+        # The inode now belongs to another file (or this one was truncated)
+        conn.execute('DELETE FROM entries WHERE inode = ?', (inode,))
+        offset = 0
+    if row and offset == size:
+        return 0
+    added = 0
+    f.seek(offset)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rest = b''
+        while True:
+            block = f.read(log_reader.BLOCK_SIZE)
+            if not block:
+                break
+            *lines, rest = (rest + block).split(b'\n')
+            rows = []
+            for line in lines:
+                parsed = _parse(log, line)
+                if parsed is not None:
+                    ts, level, fields = parsed
+                    rows.append([log, inode, offset, len(line) + 1, ts, level, *(fields[f] for f in _COLUMNS)])
+                elif rows:
+                    # Continuation of a multi-line message: it belongs to the record before
+                    rows[-1][3] += len(line) + 1
+                else:
+                    conn.execute('UPDATE entries SET length = length + ? WHERE id = '
+                                 '(SELECT MAX(id) FROM entries WHERE inode = ?)', (len(line) + 1, inode))
+                offset += len(line) + 1
+            conn.executemany(_INSERT, rows)
+            added += len(rows)
+        # A trailing line without its newline yet is picked up next time
+        conn.execute('INSERT OR REPLACE INTO files (inode, log, head, offset) VALUES (?, ?, ?, ?)',
+                     (inode, log, head, offset))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return added
+
+
+def refresh(log, path):
+    """
+    Bring the index of one log (current and rotated files) up to date. Only
+    the bytes written since the last refresh are read; entries of rotated
+    files that were deleted are dropped.
+    """
+    with _refresh_lock:
+        conn = _connect()
+        present = []
+        added = 0
+        # Oldest first, so entry ids follow the order records were written
+        for p in log_reader.log_files(path)[::-1]:
+            try:
+                f = open(p, 'rb')
+            except FileNotFoundError:  # rotated away meanwhile
+                continue
+            with f:
+                present.append(os.fstat(f.fileno()).st_ino)
+                added += _index_file(conn, log, f)
+        if added > ANALYZE_AFTER:
+            # Fresh statistics keep the planner on the field indexes rather than scanning by id
+            conn.execute('ANALYZE')
+        marks = ', '.join('?' * len(present))
+        stale = [r['inode'] for r in conn.execute(
+            f"SELECT inode FROM files WHERE log = ? AND inode NOT IN ({marks})", [log, *present])]
+        for inode in stale:
+            conn.execute('DELETE FROM entries WHERE inode = ?', (inode,))
+            conn.execute('DELETE FROM files WHERE inode = ?', (inode,))
+        return added
+
+
+def query(log, path, repo=None, command=None, server=None, commit=None, level=None,
+          since=None, until=None, before=None, limit=100):
+    """
+    Records of a log, newest first, filtered by fields, level and time (ISO,
+    since inclusive, until exclusive). Page with before=<id of the last record seen>.
+    Each record is its JSON object (text lines: ts, level, msg and the indexed fields) plus 'id'.
+    """
+    refresh(log, path)
+    where, params = ['log = ?'], [log]
+    for column, value in (('repo', repo), ('command', command), ('server', server), ('level', level)):
+        if value:
+            where.append(f'{column} = ?')
+            params.append(value)
+    if commit:
+        where.append('commit_sha >= ? AND commit_sha < ?')
+        params += [commit, commit + '￿']
+    if since:
+        where.append('ts >= ?')
+        params.append(since)
+    if until:
+        where.append('ts < ?')
+        params.append(until)
+    if before:
+        where.append('id < ?')
+        params.append(before)
+    rows = _connect().execute(
+        f"SELECT * FROM entries WHERE {' AND '.join(where)} ORDER BY id DESC LIMIT ?",
+        params + [min(limit, MAX_RESULTS)]).fetchall()
+
+    files = {}
+    for p in log_reader.log_files(path):
+        try:
+            files[os.stat(p).st_ino] = p
+        except FileNotFoundError:
+            pass
+    records = []
+    handles = {}
+    try:
+        for row in rows:
+            if row['inode'] not in files:
+                continue
+            f = handles.get(row['inode']) or handles.setdefault(row['inode'], open(files[row['inode']], 'rb'))
+            f.seek(row['offset'])
+            raw = f.read(row['length']).rstrip(b'\n')
+            if raw.startswith(b'{'):
+                record = json.loads(raw)
+            else:
+                record = {'ts': row['ts'], 'level': row['level'],
+                          'msg': raw.decode('utf-8', errors='replace').split(' ', 3)[-1]}
+                record.update({f: row[c] for f, c in _COLUMNS.items() if row[c] is not None})
+            record['id'] = row['id']
+            records.append(record)
+    finally:
+        for f in handles.values():
+            f.close()
+    return records
@@ -0,0 +1,152 @@
+import glob
+import os
+import re
+
+# Bytes read per seek when scanning a log backwards
+BLOCK_SIZE = 65536
+# Most lines returned by one call
+MAX_LINES = 1000
+# Suffix TimedRotatingFileHandler gives rotated files (when='midnight')
+_ROTATED = re.compile(r'\.\d{4}-\d{2}-\d{2}(_\d{2}(-\d{2}){0,2})?$')
+
+
+def log_files(path):
+    """The log and its rotated files, newest first."""
+    rotated = [p for p in glob.glob(f"{glob.escape(path)}.*") if _ROTATED.search(p)]
+    files = sorted(rotated, reverse=True)
+    if os.path.exists(path):
+        files.insert(0, path)
+    return files
+
+
+# A cursor is "<inode>:<offset>": rotation renames files, so the inode keeps
+# pointing at the same data whatever the file is called now.
+def _cursor(fd, offset):
+    return f"{os.fstat(fd.fileno()).st_ino}:{offset}"
+
+
+def _parse(cursor):
+    try:
+        inode, offset = cursor.split(':')
+        return int(inode), int(offset)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid log cursor: {cursor!r}")
+
+
+def _open(files):
+    """Open every file once (newest first), skipping ones rotated away meanwhile."""
+    handles = []
+    for p in files:
+        try:
+            handles.append(open(p, 'rb'))
+        except FileNotFoundError:
+            pass
+    return handles
+
+
+def _end(f):
+    """Offset just past the last complete line (a line still being written is left out)."""
+    size = f.seek(0, os.SEEK_END)
+    pos = size
+    while pos > 0:
+        start = max(0, pos - BLOCK_SIZE)
+        f.seek(start)
+        block = f.read(pos - start)
+        nl = block.rfind(b'\n')
+        if nl >= 0:
+            return start + nl + 1
+        pos = start
+    return 0
+
+
+def _lines_before(f, end, count):
+    """Up to count lines ending at offset end, read backwards in blocks; returns (start offset, lines)."""
+    pos, buf = end, b''
+    while pos > 0 and buf.count(b'\n') <= count:
+        start = max(0, pos - BLOCK_SIZE)
+        f.seek(start)
+        buf = f.read(pos - start) + buf
+        pos = start
+    lines = buf.splitlines(keepends=True)
+    if len(lines) > count:
+        lines = lines[-count:]
+    return end - sum(len(line) for line in lines), lines
+
+
+def _decode(lines):
+    return [line.decode('utf-8', errors='replace').rstrip('\r\n') for line in lines]
+
+
+def tail(path, lines=10, before=None):
+    """
+    The last `lines` lines of a log, oldest first, continuing into rotated
+    files when the current one is shorter. Returns {'lines', 'before', 'since'}:
+    pass 'before' back to page further into the past (None at the very
+    start) and 'since' to since() to get only what was written after.
+    """
+    lines = max(1, min(lines, MAX_LINES))
+    handles = _open(log_files(path))
+    try:
+        if not handles:
+            return {'lines': [], 'before': None, 'since': None}
+        since = _cursor(handles[0], _end(handles[0]))
+        i, end = 0, None
+        if before:
+            inode, end = _parse(before)
+            i = next((n for n, f in enumerate(handles) if os.fstat(f.fileno()).st_ino == inode), None)
+            if i is None:  # deleted by the rotation's backupCount
+                return {'lines': [], 'before': None, 'since': since}
+        found, cursor = [], None
+        for n, f in enumerate(handles[i:], i):
+            start, chunk = _lines_before(f, _end(f) if end is None else end, lines - len(found))
+            found = _decode(chunk) + found
+            # At the start of a file the cursor stays on it; paging from there moves to the older one
+            cursor = _cursor(f, start) if start > 0 or n + 1 < len(handles) else None
+            end = None
+            if len(found) >= lines:
+                break
+        return {'lines': found, 'before': cursor, 'since': since}
+    finally:
+        for f in handles:
+            f.close()
+
+
+def since(path, cursor, limit=MAX_LINES):
+    """
+    Lines written after cursor, oldest first, following the log across a
+    rotation. Returns {'lines', 'since', 'more'}; 'more' is True when limit
+    stopped the read early (call again with the new 'since').
+    """
+    inode, offset = _parse(cursor)
+    handles = _open(log_files(path))
+    try:
+        if not handles:
+            return {'lines': [], 'since': None, 'more': False}
+        i = next((n for n, f in enumerate(handles) if os.fstat(f.fileno()).st_ino == inode), None)
+        if i is None:
+            # The cursor's file is gone: start over from the current file
+            i, offset = 0, 0
+        found = []
+        # Walk from the cursor's file towards the current one (index 0)
+        for n in range(i, -1, -1):
+            f = handles[n]
+            end = _end(f)
+            if offset > end:  # truncated and rewritten
+                offset = 0
+            f.seek(offset)
+            pos, rest = offset, b''
+            while pos < end:
+                block = f.read(min(BLOCK_SIZE, end - pos))
+                pos += len(block)
+                *complete, rest = (rest + block).split(b'\n')
+                for line in complete:
+                    if len(found) == limit:
+                        return {'lines': _decode(found), 'since': _cursor(f, offset), 'more': True}
+                    found.append(line)
+                    offset += len(line) + 1
+            if n:
+                offset = 0
+        return {'lines': _decode(found), 'since': _cursor(handles[0], offset), 'more': False}
+    finally:
+        for f in handles:
+            f.close()
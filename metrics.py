@@ -0,0 +1,144 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the histogram buckets, from API calls up to long deploys
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _samples(self):
+        with self._lock:
+            return [(key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._samples()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count; label values are passed positionally, in the order of `labels`."""
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(_Metric):
+    """Current value, either set directly or read from fn() at scrape time ({label values: value})."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self._fn = fn
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def _samples(self):
+        if self._fn:
+            return list(self._fn().items())
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (seconds) over fixed buckets."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, *label_values):
+        # One bucket is incremented here; the cumulative counts are summed when rendering
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * len(self.buckets), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, *label_values)
+
+    def _samples(self):
+        with self._lock:
+            return [(key, (list(counts), total)) for key, (counts, total) in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total) in sorted(self._samples()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ---------- runner pipeline ----------
+
+GITHUB_REQUEST_SECONDS = Histogram(
+    'rpr_github_request_seconds', 'GitHub API call latency', ('api',))
+SSH_CONNECT_SECONDS = Histogram(
+    'rpr_ssh_connect_seconds', 'SSH connection setup latency (new pooled connections)', ('server',))
+GIT_SETUP_SECONDS = Histogram(
+    'rpr_git_setup_seconds', 'Time to bring a server checkout to the deployed commit', ('strategy',))
+COMMAND_SECONDS = Histogram(
+    'rpr_command_seconds', 'Run time of the user command on the server', ('repo',))
+SWEEP_SECONDS = Histogram(
+    'rpr_sweep_seconds', 'Duration of a check_repos / check_servers sweep', ('sweep',))
+DEPLOYS = Counter(
+    'rpr_deploys_total', 'Command runs by outcome (ok, failed, setup_failed, error, skipped, coalesced)',
+    ('repo', 'server', 'status'))
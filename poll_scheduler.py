@@ -0,0 +1,135 @@
+import heapq
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+# How often the scheduler looks for due items
+TICK_SECONDS = 30
+# Each start is pushed back by up to this share of the item's interval, capped
+JITTER = 0.1
+MAX_JITTER_SECONDS = 60
+
+
+def _timestamp(iso):
+    # Runner timestamps are naive UTC
+    return datetime.fromisoformat(iso).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _jitter(interval):
+    return random.uniform(0, min(JITTER * interval, MAX_JITTER_SECONDS))
+
+
+def repo_interval(cfg, repo):
+    """Poll interval of a repo in seconds (per-repo 'interval' in minutes, else 'repo_interval' hours)."""
+    if repo.get('interval'):
+        return float(repo['interval']) * 60
+    return float(cfg.get('repo_interval', 24)) * 3600
+
+
+def server_interval(cfg, srv):
+    """Check interval of a server in seconds (per-server 'interval' in minutes, else 'server_interval' hours)."""
+    if srv.get('interval'):
+        return float(srv['interval']) * 60
+    return float(cfg.get('server_interval', 12)) * 3600
+
+
+class PollScheduler:
+    """
+    Due-time heap over every active repo and server. Each tick re-syncs with
+    the config and dispatches only the items whose due time has passed.
+    Due times come from the 'next_poll' / 'next_check' fields the runner
+    persists, plus jitter so items sharing an interval do not start together.
+    """
+
+    def __init__(self, load_config, dispatch):
+        self._load_config = load_config
+        self._dispatch = dispatch  # {'repo': fn(names), 'server': fn(hosts)}
+        self._heap = []
+        self._due = {}   # (kind, key) -> due timestamp; heap entries not matching are stale
+        self._seen = {}  # (kind, key) -> (persisted next run, interval) at last sync
+        self._running = set()  # (kind, key) dispatched and not finished yet
+        self._lock = threading.Lock()
+
+    def _items(self, cfg):
+        for r in cfg.get('repos', []):
+            if r.get('active', False):
+                yield ('repo', r['name']), repo_interval(cfg, r), r.get('next_poll')
+        for s in cfg.get('servers', []):
+            yield ('server', s['host']), server_interval(cfg, s), s.get('next_check')
+
+    def _push(self, item, due):
+        self._due[item] = due
+        heapq.heappush(self._heap, (due, item))
+
+    def sync(self, cfg=None):
+        """Bring the heap in line with the config (new, removed or rescheduled items)."""
+        cfg = cfg or self._load_config()
+        now = time.time()
+        current = set()
+        with self._lock:
+            for item, interval, persisted in self._items(cfg):
+                current.add(item)
+                seen = self._seen.get(item)
+                if seen == (persisted, interval):
+                    continue
+                self._seen[item] = (persisted, interval)
+                jitter = _jitter(interval)
+                if persisted:
+                    due = _timestamp(persisted) + jitter
+                elif seen is None:
+                    # Never run: spread first starts across one interval
+                    due = now + random.uniform(0, interval)
+                else:
+                    due = now + interval + jitter
+                if seen and seen[1] != interval and item in self._due:
+                    # Interval changed: apply it without waiting out the old one
+                    due = min(due, self._due[item], now + interval + jitter)
+                self._push(item, due)
+            for item in [i for i in self._due if i not in current]:
+                del self._due[item]
+                self._seen.pop(item, None)
+
+    def _run(self, kind, keys):
+        try:
+            self._dispatch[kind](keys)
+        finally:
+            with self._lock:
+                self._running.difference_update((kind, key) for key in keys)
+
+    def tick(self):
+        """
+        Dispatch every item that is due, grouped by kind, each group on its own
+        thread. Items whose previous dispatch is still running are retried next tick.
+        """
+        self.sync()
+        now = time.time()
+        due, retry = {}, []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, item = heapq.heappop(self._heap)
+                if self._due.get(item) != when:
+                    continue
+                if item in self._running:
+                    retry.append(item)
+                    continue
+                self._running.add(item)
+                due.setdefault(item[0], []).append(item[1])
+                # Provisional next run; replaced once the runner persists the real one
+                interval = self._seen[item][1]
+                self._push(item, now + interval + _jitter(interval))
+            for item in retry:
+                self._push(item, now + TICK_SECONDS)
+        for kind, keys in due.items():
+            threading.Thread(target=self._run, args=(kind, keys),
+                             name=f'{kind}-check', daemon=True).start()
+        return due
+
+    def next_runs(self):
+        """Next run of every scheduled item, soonest first."""
+        with self._lock:
+            entries = sorted((due, item) for item, due in self._due.items())
+        return [{'kind': kind, 'name': key,
+                 'interval_minutes': round(self._seen[(kind, key)][1] / 60, 1),
+                 'next_run': datetime.fromtimestamp(due, timezone.utc).isoformat()}
+                for due, (kind, key) in entries]
@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+RUNS_DIR = os.path.join('logs', 'runs')
+# Bytes of each stream kept in memory for the run summary
+HEAD_BYTES = 4096
+TAIL_BYTES = 4096
+# Bytes read from a channel at a time
+CHUNK = 32768
+# Per-run output files are kept as long as the rotated logs
+RETENTION_DAYS = 7
+# Lines of a live run kept in memory for viewers that attach late
+REPLAY_LINES = 5000
+
+_live = {}     # run_id -> RunOutput of runs in progress
+_latest = {}   # cmd_id -> run_id of its most recent run
+_registry = threading.Condition()
+
+
+class _Summary:
+    """First HEAD_BYTES and last TAIL_BYTES of a stream, in bounded memory."""
+
+    def __init__(self):
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def add(self, data):
+        self.total += len(data)
+        room = HEAD_BYTES - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            del self.tail[:-TAIL_BYTES]
+
+    def text(self):
+        skipped = self.total - len(self.head) - len(self.tail)
+        text = self.head.decode(errors='replace')
+        if skipped > 0:
+            text += f"\n... [{skipped} bytes truncated] ...\n"
+        return (text + self.tail.decode(errors='replace')).strip()
+
+
+def _prune_runs():
+    cutoff = time.time() - RETENTION_DAYS * 86400
+    for name in os.listdir(RUNS_DIR):
+        path = os.path.join(RUNS_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class RunOutput:
+    """
+    Output of one command run: every line is appended to a per-run file under
+    logs/runs as it arrives, while only a head/tail summary of the current step
+    is kept in memory.
+    """
+
+    def __init__(self, cmd_id):
+        os.makedirs(RUNS_DIR, exist_ok=True)
+        _prune_runs()
+        self.run_id = f"{cmd_id}-{datetime.utcnow():%Y%m%dT%H%M%S%f}"
+        self.path = os.path.join(RUNS_DIR, f"{self.run_id}.log")
+        self._file = open(self.path, 'ab')
+        self._partial = {'stdout': b'', 'stderr': b''}
+        # Live view: numbered lines for viewers, woken on every new line
+        self._lines = deque(maxlen=REPLAY_LINES)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self.done = False
+        self.exit_status = None
+        with _registry:
+            _live[self.run_id] = self
+            _latest[cmd_id] = self.run_id
+            _registry.notify_all()
+        self.begin('run')
+
+    def begin(self, step):
+        """Start a new step: write a marker line and reset the summaries."""
+        self._flush_partial()
+        self._write_line(f"==> {step}".encode())
+        self.stdout = _Summary()
+        self.stderr = _Summary()
+
+    def write(self, stream, data):
+        (self.stdout if stream == 'stdout' else self.stderr).add(data)
+        *lines, self._partial[stream] = (self._partial[stream] + data).split(b'\n')
+        for line in lines:
+            self._write_line(line, stream)
+
+    def _write_line(self, line, stream='stdout'):
+        prefix = b'[stderr] ' if stream == 'stderr' else b''
+        line = prefix + line.rstrip(b'\r')
+        self._file.write(line + b'\n')
+        self._file.flush()
+        with self._cond:
+            self._seq += 1
+            self._lines.append((self._seq, line.decode(errors='replace')))
+            self._cond.notify_all()
+
+    def _flush_partial(self):
+        for stream, rest in self._partial.items():
+            if rest:
+                self._write_line(rest, stream)
+            self._partial[stream] = b''
+
+    def pump(self, channel, poll=0.05):
+        """Copy stdout/stderr of a running channel here until the command exits; return its status."""
+        while True:
+            busy = False
+            if channel.recv_ready():
+                self.write('stdout', channel.recv(CHUNK))
+                busy = True
+            if channel.recv_stderr_ready():
+                self.write('stderr', channel.recv_stderr(CHUNK))
+                busy = True
+            if not busy:
+                if channel.exit_status_ready():
+                    break
+                time.sleep(poll)
+        # Data that arrived together with the exit status
+        while channel.recv_ready():
+            self.write('stdout', channel.recv(CHUNK))
+        while channel.recv_stderr_ready():
+            self.write('stderr', channel.recv_stderr(CHUNK))
+        self._flush_partial()
+        self.exit_status = channel.recv_exit_status()
+        return self.exit_status
+
+    def follow(self, after=0, timeout=None):
+        """
+        Yield (seq, line) for every line after `after`, replaying what is buffered
+        and then waiting for new lines until the run ends. Yields None when nothing
+        arrived within `timeout` seconds, so callers can send keepalives.
+        """
+        while True:
+            with self._cond:
+                if self._seq <= after and not self.done:
+                    self._cond.wait(timeout)
+                pending = [entry for entry in self._lines if entry[0] > after]
+                done = self.done
+            if pending:
+                if pending[0][0] > after + 1:
+                    # Viewer fell behind the replay buffer
+                    yield pending[0][0] - 1, f"... [{pending[0][0] - after - 1} lines skipped, see {self.path}] ..."
+                for entry in pending:
+                    yield entry
+                after = pending[-1][0]
+            elif done:
+                return
+            else:
+                yield None
+
+    def close(self):
+        self._flush_partial()
+        self._file.close()
+        with self._cond:
+            self.done = True
+            self._cond.notify_all()
+        with _registry:
+            _live.pop(self.run_id, None)
+
+
+def live_run(cmd_id=None, run_id=None):
+    """In-progress run by id, or the current run of a command."""
+    with _registry:
+        return _live.get(run_id or _latest.get(cmd_id))
+
+
+def next_run(cmd_id, wait):
+    """
+    The command's run in progress, or the next one to start within `wait`
+    seconds. Returns (RunOutput, run_id) while the run is live, (None, run_id)
+    when it already finished and (None, None) when no run started in time.
+    """
+    deadline = time.monotonic() + wait
+    with _registry:
+        previous = _latest.get(cmd_id)
+        while True:
+            latest = _latest.get(cmd_id)
+            run = _live.get(latest)
+            if run or latest != previous:
+                return run, latest
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None, None
+            _registry.wait(remaining)
+
+
+def run_file(run_id):
+    """Path of a finished run's output file, or None."""
+    path = os.path.join(RUNS_DIR, f"{run_id}.log")
+    if os.path.basename(path) != f"{run_id}.log" or not os.path.exists(path):
+        return None
+    return path
+
+
+def latest_run_id(cmd_id):
+    with _registry:
+        return _latest.get(cmd_id)
@@ -2,14 +2,35 @@ import os
 import json
 import base64
 import uuid
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.backends import default_backend
 from cryptography.fernet import Fernet
 
+import config_store
+
 # Files for storing keys and encrypted secrets
 KEYS_FILE = 'keys.json'
 SECRETS_FILE = 'secrets.json'
+# secrets.json format: 2 = {'version', 'kdf', 'secrets': {id: record}}; 1 = a list of records with a salt each
+STORE_VERSION = 2
+KDF_ITERATIONS = 100000
+# Derived keys are kept in memory so PBKDF2 runs once per store, not per read
+KEY_CACHE_TTL = 900
+KEY_CACHE_MAX = 1024
+
+_lock = threading.Lock()
+_store_lock = threading.Lock()  # taken by _locked_store along with the file lock
+_files = {}          # path -> (stamp, parsed contents)
+_store_key = {}      # 'key': (encryption key, salt, derived store key, expires)
+_key_cache = OrderedDict()  # secret id -> (store key, fernet key, expires), least recently used first
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
 
 
 def _ensure_file(path, default):
@@ -19,10 +40,36 @@ def _ensure_file(path, default):
         os.chmod(path, 0o700)
 
 
+@contextmanager
+def _locked_store():
+    """secrets.json.lock (see config_store.file_lock) plus the in-process lock."""
+    with _store_lock, config_store.file_lock(SECRETS_FILE):
+        yield
+
+
+def _read_json(path):
+    """Parsed contents of a JSON file, re-read only when the file changed."""
+    stamp = config_store.file_stamp(path)
+    with _lock:
+        cached = _files.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+    with open(path, 'r') as f:
+        data = json.load(f)
+    with _lock:
+        _files[path] = (stamp, data)
+    return data
+
+
+def _write_json(path, data):
+    config_store.atomic_write_json(path, data, mode=0o700)
+    with _lock:
+        _files[path] = (config_store.file_stamp(path), data)
+
+
 def load_keys():
     _ensure_file(KEYS_FILE, {})
-    with open(KEYS_FILE, 'r') as f:
-        data = json.load(f)
+    data = dict(_read_json(KEYS_FILE))
     # Generate keys on first run
     changed = False
     if 'api_key' not in data:
@@ -32,65 +79,164 @@ def load_keys():
         data['encryption_key'] = base64.urlsafe_b64encode(Fernet.generate_key()).decode()
         changed = True
     if changed:
-        with open(KEYS_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        _write_json(KEYS_FILE, data)
     return data
 
 
-def _derive_fernet_key(encryption_key: bytes, salt: bytes) -> bytes:
+def _encryption_key():
+    return base64.urlsafe_b64decode(load_keys()['encryption_key'].encode())
+
+
+def _derive_fernet_key(encryption_key: bytes, salt: bytes, iterations=KDF_ITERATIONS) -> bytes:
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
         salt=salt,
-        iterations=100000,
+        iterations=iterations,
         backend=default_backend()
     )
     return base64.urlsafe_b64encode(kdf.derive(encryption_key))
 
 
-def _load_secrets():
-    _ensure_file(SECRETS_FILE, [])
-    with open(SECRETS_FILE, 'r') as f:
-        return json.load(f)
+def _derive_store_key(enc_key, kdf):
+    """PBKDF2 of the encryption key with the store's salt, cached for KEY_CACHE_TTL."""
+    salt = base64.b64decode(kdf['salt'].encode())
+    now = time.monotonic()
+    with _lock:
+        cached = _store_key.get('key')
+        if cached and cached[0] == enc_key and cached[1] == salt and cached[3] > now:
+            return cached[2]
+    store_key = base64.urlsafe_b64decode(_derive_fernet_key(enc_key, salt, kdf['iterations']))
+    with _lock:
+        _store_key['key'] = (enc_key, salt, store_key, now + KEY_CACHE_TTL)
+    return store_key
+
+
+def _subkey(store_key, secret_id):
+    """Per-secret Fernet key: HKDF of the store key, bound to the secret id."""
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                info=f"rpr-secret:{secret_id}".encode(), backend=default_backend())
+    return base64.urlsafe_b64encode(hkdf.derive(store_key))
+
+
+def _cached_key(secret_id, store_key):
+    """Fernet key for a secret, deriving it on a miss. Entries expire after KEY_CACHE_TTL."""
+    now = time.monotonic()
+    with _lock:
+        entry = _key_cache.get(secret_id)
+        if entry and entry[0] == store_key and entry[2] > now:
+            _key_cache.move_to_end(secret_id)
+            _stats['hits'] += 1
+            return entry[1]
+        _stats['misses'] += 1
+    fkey = _subkey(store_key, secret_id)
+    with _lock:
+        _key_cache[secret_id] = (store_key, fkey, now + KEY_CACHE_TTL)
+        _key_cache.move_to_end(secret_id)
+        while len(_key_cache) > KEY_CACHE_MAX:
+            _key_cache.popitem(last=False)
+            _stats['evictions'] += 1
+    return fkey
+
+
+def invalidate(secret_id=None):
+    """Forget the cached key of one secret, or every cached key."""
+    with _lock:
+        if secret_id is None:
+            _key_cache.clear()
+            _store_key.clear()
+        else:
+            _key_cache.pop(secret_id, None)
+
+
+def cache_stats():
+    """Hit/miss/eviction counters and current size of the derived-key cache."""
+    with _lock:
+        return {**_stats, 'size': len(_key_cache), 'max': KEY_CACHE_MAX, 'ttl': KEY_CACHE_TTL}
+
+
+def _migrate(records, enc_key):
+    """Re-encrypt a version 1 store (one PBKDF2 salt per record) under a version 2 store key."""
+    store = _new_store()
+    store_key = _derive_store_key(enc_key, store['kdf'])
+    for rec in records:
+        salt = base64.b64decode(rec['salt'].encode())
+        token = base64.b64decode(rec['encrypted_data'].encode())
+        plaintext = Fernet(_derive_fernet_key(enc_key, salt)).decrypt(token)
+        store['secrets'][rec['id']] = _encrypt(store_key, rec['id'], rec['name'], plaintext)
+    with open(f"{SECRETS_FILE}.v1.bak", 'w') as f:
+        json.dump(records, f, indent=2)
+    os.chmod(f"{SECRETS_FILE}.v1.bak", 0o700)
+    _write_json(SECRETS_FILE, store)
+    return store
 
 
-def _save_secrets(records):
-    with open(SECRETS_FILE, 'w') as f:
-        json.dump(records, f, indent=2)
-    #os.chmod(SECRETS_FILE, 0o700)
+def _new_store():
+    return {
+        'version': STORE_VERSION,
+        'kdf': {'algorithm': 'pbkdf2-sha256', 'iterations': KDF_ITERATIONS,
+                'salt': base64.b64encode(os.urandom(16)).decode()},
+        'secrets': {}
+    }
+
+
+def _load_store():
+    """The version 2 store, migrating a version 1 file on first use."""
+    _ensure_file(SECRETS_FILE, _new_store())
+    data = _read_json(SECRETS_FILE)
+    if isinstance(data, list):
+        with _locked_store():
+            data = _read_json(SECRETS_FILE)
+            if isinstance(data, list):
+                data = _migrate(data, _encryption_key())
+    return data
+
+
+def _encrypt(store_key, secret_id, name, plaintext: bytes):
+    token = Fernet(_cached_key(secret_id, store_key)).encrypt(plaintext)
+    return {'name': name, 'encrypted_data': base64.b64encode(token).decode()}
 
 
 def store_secret(name: str, plaintext: str) -> str:
-    keys = load_keys()
-    enc_key = base64.urlsafe_b64decode(keys['encryption_key'].encode())
-    salt = os.urandom(16)
-    fkey = _derive_fernet_key(enc_key, salt)
-    f = Fernet(fkey)
-    token = f.encrypt(plaintext.encode())
-    record = {
-        'id': uuid.uuid4().hex,
-        'name': name,
-        'salt': base64.b64encode(salt).decode(),
-        'encrypted_data': base64.b64encode(token).decode()
-    }
-    records = _load_secrets()
-    records.append(record)
-    _save_secrets(records)
-    return record['id']
+    store = _load_store()
+    store_key = _derive_store_key(_encryption_key(), store['kdf'])
+    secret_id = uuid.uuid4().hex
+    record = _encrypt(store_key, secret_id, name, plaintext.encode())
+    with _locked_store():
+        store = _read_json(SECRETS_FILE)
+        _write_json(SECRETS_FILE, {**store, 'secrets': {**store['secrets'], secret_id: record}})
+    return secret_id
+
+
+def get_secrets(secret_ids) -> dict:
+    """
+    Decrypt several secrets with a single store key derivation.
+    Returns {id: plaintext}; ids that are not stored are left out.
+    """
+    store = _load_store()
+    store_key = _derive_store_key(_encryption_key(), store['kdf'])
+    found = {}
+    for secret_id in secret_ids:
+        rec = store['secrets'].get(secret_id)
+        if rec:
+            token = base64.b64decode(rec['encrypted_data'].encode())
+            found[secret_id] = Fernet(_cached_key(secret_id, store_key)).decrypt(token).decode()
+    return found
 
 
 def get_secret(secret_id: str) -> str:
-    keys = load_keys()
-    enc_key = base64.urlsafe_b64decode(keys['encryption_key'].encode())
-    records = _load_secrets()
-    rec = next((r for r in records if r['id'] == secret_id), None)
+    found = get_secrets([secret_id])
+    if secret_id not in found:
+        raise KeyError(f"Secret {secret_id} not found")
+    return found[secret_id]
+
+
+def secret_version(secret_id: str) -> str:
+    """Cheap identifier of a stored record (no decryption); changes when it is rewritten."""
+    rec = _load_store()['secrets'].get(secret_id)
     if not rec:
         raise KeyError(f"Secret {secret_id} not found")
-    salt = base64.b64decode(rec['salt'].encode())
-    token = base64.b64decode(rec['encrypted_data'].encode())
-    fkey = _derive_fernet_key(enc_key, salt)
-    f = Fernet(fkey)
-    return f.decrypt(token).decode()
+    return hashlib.sha256(rec['encrypted_data'].encode()).hexdigest()[:16]
 
 
 def mask_secret(plaintext: str) -> str:
@@ -99,7 +245,10 @@ def mask_secret(plaintext: str) -> str:
 
 
 def delete_secret(secret_id: str):
-    records = _load_secrets()
-    filtered = [r for r in records if r['id'] != secret_id]
-    if len(filtered) != len(records):
-        _save_secrets(filtered)
+    _load_store()
+    with _locked_store():
+        store = _read_json(SECRETS_FILE)
+        if secret_id in store['secrets']:
+            secrets = {k: v for k, v in store['secrets'].items() if k != secret_id}
+            _write_json(SECRETS_FILE, {**store, 'secrets': secrets})
+    invalidate(secret_id)
@@ -0,0 +1,98 @@
+import socket
+import threading
+import time
+from contextlib import contextmanager
+import paramiko
+import metrics
+
+CONNECT_TIMEOUT = 10
+# Keepalive packets keep NAT/firewall state alive between uses
+KEEPALIVE_SECONDS = 30
+# Connections unused for this long are closed
+IDLE_SECONDS = 300
+
+
+class _Entry:
+    def __init__(self, client):
+        self.client = client
+        self.users = 0
+        self.last_used = time.monotonic()
+
+
+_pool = {}  # (host, user, key_path) -> _Entry
+_connect_locks = {}
+_lock = threading.Lock()
+
+
+def _alive(client):
+    transport = client.get_transport()
+    return transport is not None and transport.is_active()
+
+
+def _connect(host, user, key_path):
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    with metrics.SSH_CONNECT_SECONDS.time(host):
+        client.connect(hostname=host, username=user, key_filename=key_path, timeout=CONNECT_TIMEOUT)
+    client.get_transport().set_keepalive(KEEPALIVE_SECONDS)
+    return client
+
+
+def _acquire(key):
+    with _lock:
+        connect_lock = _connect_locks.setdefault(key, threading.Lock())
+    # One handshake per key at a time; other callers wait and then share the transport
+    with connect_lock:
+        with _lock:
+            entry = _pool.get(key)
+            if entry and _alive(entry.client):
+                entry.users += 1
+                return entry
+            stale = _pool.pop(key, None)
+        if stale:
+            stale.client.close()
+        entry = _Entry(_connect(*key))
+        entry.users = 1
+        with _lock:
+            _pool[key] = entry
+        return entry
+
+
+def discard(host, user, key_path):
+    """Close and forget the pooled connection for a host."""
+    with _lock:
+        entry = _pool.pop((host, user, key_path), None)
+    if entry:
+        entry.client.close()
+
+
+def evict_idle():
+    """Close connections that are broken, or idle for longer than IDLE_SECONDS."""
+    now = time.monotonic()
+    with _lock:
+        stale = [key for key, e in _pool.items()
+                 if e.users == 0 and (now - e.last_used > IDLE_SECONDS or not _alive(e.client))]
+        entries = [_pool.pop(key) for key in stale]
+    for entry in entries:
+        entry.client.close()
+
+
+@contextmanager
+def session(host, user, key_path):
+    """
+    Yield a connected SSHClient for (host, user, key), reusing a pooled transport
+    when one is alive. Each exec_command opens a new channel on it. Connections
+    that fail while in use are evicted so the next caller reconnects.
+    """
+    evict_idle()
+    key = (host, user, key_path)
+    entry = _acquire(key)
+    try:
+        yield entry.client
+    except (paramiko.SSHException, socket.error, EOFError):
+        discard(*key)
+        raise
+    finally:
+        with _lock:
+            entry.users -= 1
+            entry.last_used = time.monotonic()
@@ -0,0 +1,255 @@
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+import config_store
+
+DB_FILE = 'state.db'
+# Entries kept as JSON documents, by kind, with the field that identifies them
+KINDS = {'repos': 'name', 'servers': 'host', 'commands': 'id'}
+# Seconds a writer waits for another process's transaction to finish
+BUSY_TIMEOUT = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS repos (name TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS servers (host TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS commands (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT,
+    command_id TEXT NOT NULL,
+    server TEXT,
+    repo TEXT,
+    commit_sha TEXT,
+    status TEXT NOT NULL,
+    exit_status INTEGER,
+    started TEXT NOT NULL,
+    finished TEXT,
+    seconds REAL,
+    error TEXT,
+    output_file TEXT,
+    fetch_strategy TEXT,
+    setup_seconds REAL,
+    fetch_bytes INTEGER,
+    coalesced INTEGER,
+    skipped INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_command ON runs (command_id, id);
+CREATE INDEX IF NOT EXISTS runs_server ON runs (server, id);
+CREATE INDEX IF NOT EXISTS runs_commit ON runs (commit_sha, id);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS runs_run_id ON runs (run_id);
+"""
+# Columns added to an existing runs table on open
+_RUN_COLUMNS = {'fetch_strategy': 'TEXT', 'setup_seconds': 'REAL', 'fetch_bytes': 'INTEGER',
+                'coalesced': 'INTEGER', 'skipped': 'INTEGER'}
+
+logger = logging.getLogger('runner')
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialised = set()  # database paths whose schema/migration ran in this process
+
+
+def _connect():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.path == DB_FILE:
+        return conn
+    # Autocommit; writers open their own IMMEDIATE transactions
+    conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    with _init_lock:
+        if DB_FILE not in _initialised:
+            conn.executescript(_SCHEMA)
+            existing = {row['name'] for row in conn.execute('PRAGMA table_info(runs)')}
+            for column, kind in _RUN_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE runs ADD COLUMN {column} {kind}")
+            _migrate_config(conn)
+            _initialised.add(DB_FILE)
+    _local.conn, _local.path = conn, DB_FILE
+    return conn
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT: takes the write lock up front so read-modify-write is safe across processes."""
+
+    def __enter__(self):
+        self.conn = _connect()
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+def _migrate_config(conn):
+    """
+    Move repos, servers and commands out of config.json on first start. The
+    original file is kept as config.json.bak; config.json keeps the settings.
+    Lists found again later (a restored or hand-edited old config.json) are
+    merged: entries not in the database are imported, existing ones are kept,
+    and the file is backed up as config.json.<time>.bak before being stripped.
+    """
+    with config_store.transaction() as cfg:
+        if not any(kind in cfg for kind in KINDS):
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            migrated = conn.execute("SELECT value FROM meta WHERE key = 'config_migrated'").fetchone()
+            # The first migration takes config.json as the truth; later ones never overwrite
+            insert = 'INSERT OR IGNORE' if migrated else 'INSERT OR REPLACE'
+            imported = 0
+            for kind, key in KINDS.items():
+                for entry in cfg.get(kind, []):
+                    imported += conn.execute(f"{insert} INTO {kind} ({key}, data) VALUES (?, ?)",
+                                             (entry[key], json.dumps(entry))).rowcount
+            if not migrated:
+                conn.execute("INSERT INTO meta (key, value) VALUES ('config_migrated', datetime('now'))")
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        backup = f"{config_store.CONFIG_FILE}.bak"
+        if migrated:
+            backup = f"{config_store.CONFIG_FILE}.{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.bak"
+            logger.warning(f"config.json lists repos/servers/commands again: imported {imported} new entries "
+                           f"into {DB_FILE}, kept the existing ones, original saved as {backup}")
+        with open(backup, 'w') as f:
+            json.dump(cfg, f, indent=2)
+        for kind in KINDS:
+            cfg.pop(kind, None)
+
+
+# ---------- repos / servers / commands ----------
+
+def items(kind):
+    """All entries of a kind, in the order they were added."""
+    rows = _connect().execute(f"SELECT data FROM {kind} ORDER BY rowid").fetchall()
+    return [json.loads(row['data']) for row in rows]
+
+
+def snapshot():
+    """{'repos': [...], 'servers': [...], 'commands': [...]}, read in one transaction."""
+    conn = _connect()
+    conn.execute('BEGIN')
+    try:
+        return {kind: items(kind) for kind in KINDS}
+    finally:
+        conn.execute('COMMIT')
+
+
+def get(kind, key):
+    row = _connect().execute(f"SELECT data FROM {kind} WHERE {KINDS[kind]} = ?", (key,)).fetchone()
+    return json.loads(row['data']) if row else None
+
+
+def put(kind, entry, replace=True):
+    """Insert an entry (replacing one with the same key). With replace=False, returns False if it exists."""
+    key = entry[KINDS[kind]]
+    with _Transaction() as conn:
+        exists = conn.execute(f"SELECT 1 FROM {kind} WHERE {KINDS[kind]} = ?", (key,)).fetchone()
+        if exists and not replace:
+            return False
+        if exists:
+            conn.execute(f"UPDATE {kind} SET data = ? WHERE {KINDS[kind]} = ?", (json.dumps(entry), key))
+        else:
+            conn.execute(f"INSERT INTO {kind} ({KINDS[kind]}, data) VALUES (?, ?)", (key, json.dumps(entry)))
+    return True
+
+
+def update(kind, key, fields=None, fn=None):
+    """
+    Change one entry in place: set `fields` (a None value removes the field),
+    then apply fn(entry) if given. Returns the updated entry, or None if missing.
+    """
+    with _Transaction() as conn:
+        row = conn.execute(f"SELECT data FROM {kind} WHERE {KINDS[kind]} = ?", (key,)).fetchone()
+        if not row:
+            return None
+        entry = json.loads(row['data'])
+        for field, value in (fields or {}).items():
+            if value is None:
+                entry.pop(field, None)
+            else:
+                entry[field] = value
+        if fn:
+            fn(entry)
+        conn.execute(f"UPDATE {kind} SET data = ? WHERE {KINDS[kind]} = ?", (json.dumps(entry), key))
+    return entry
+
+
+def update_many(kind, updates):
+    """Apply {key: fields} to several entries in one transaction (missing keys are skipped)."""
+    with _Transaction() as conn:
+        for key, fields in updates.items():
+            row = conn.execute(f"SELECT data FROM {kind} WHERE {KINDS[kind]} = ?", (key,)).fetchone()
+            if not row:
+                continue
+            entry = json.loads(row['data'])
+            for field, value in fields.items():
+                if value is None:
+                    entry.pop(field, None)
+                else:
+                    entry[field] = value
+            conn.execute(f"UPDATE {kind} SET data = ? WHERE {KINDS[kind]} = ?", (json.dumps(entry), key))
+
+
+def delete(kind, key):
+    """Remove an entry; returns True if it existed."""
+    with _Transaction() as conn:
+        return conn.execute(f"DELETE FROM {kind} WHERE {KINDS[kind]} = ?", (key,)).rowcount > 0
+
+
+# ---------- run history ----------
+
+def record_run(run):
+    """Append a finished run (dict with the runs table's columns); returns its row id."""
+    columns = ['run_id', 'command_id', 'server', 'repo', 'commit_sha', 'status', 'exit_status',
+               'started', 'finished', 'seconds', 'error', 'output_file'] + list(_RUN_COLUMNS)
+    with _Transaction() as conn:
+        cur = conn.execute(
+            f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [run.get(c) for c in columns])
+        return cur.lastrowid
+
+
+def get_run(run_id):
+    """The recorded run with this run_id (see run_output.RunOutput), or None."""
+    row = _connect().execute('SELECT * FROM runs WHERE run_id = ? ORDER BY id DESC LIMIT 1', (run_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def run_history(command_id=None, server=None, commit=None, since=None, before=None, limit=50):
+    """
+    Most recent runs first, filtered by command, server, commit prefix and/or
+    start time (ISO, inclusive). Page with before=<id of the last row seen>.
+    """
+    where, params = [], []
+    if command_id:
+        where.append('command_id = ?')
+        params.append(command_id)
+    if server:
+        where.append('server = ?')
+        params.append(server)
+    if commit:
+        # Prefix match stays on the index: commit_sha >= prefix AND < prefix + max char
+        where.append('commit_sha >= ? AND commit_sha < ?')
+        params += [commit, commit + '￿']
+    if since:
+        where.append('started >= ?')
+        params.append(since)
+    if before:
+        where.append('id < ?')
+        params.append(before)
+    sql = 'SELECT * FROM runs'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY id DESC LIMIT ?'
+    params.append(limit)
+    return [dict(row) for row in _connect().execute(sql, params).fetchall()]
@@ -8,6 +8,15 @@ document.addEventListener('DOMContentLoaded', async () => {
   const token = getCookie('auth_token');
   const headers = token ? { 'X-Auth-Token': token, 'Content-Type': 'application/json' } : { 'Content-Type': 'application/json' };
 
+  // Poll a background job until it finishes; resolves with the job
+  async function waitForJob(jobId, intervalMs = 1000) {
+    while (true) {
+      const job = await request(`/api/jobs/${jobId}`, { method: 'GET', headers });
+      if (job.state === 'done' || job.state === 'failed') return job;
+      await new Promise(r => setTimeout(r, intervalMs));
+    }
+  }
+
   // Error-handling fetch wrapper
   async function request(url, opts = {}) {
     // Attach CSRF token for state-changing requests
@@ -59,15 +68,18 @@ document.addEventListener('DOMContentLoaded', async () => {
     }
   }
 
-  // Load schedule for Next Check
+  // Load schedule for Next Check; returns next run per item keyed by kind and name
   async function loadSchedule() {
+    const nextRuns = {};
     try {
       const sched = await request('/api/schedule', { method: 'GET', headers });
       const nr = document.getElementById('next-repo');
       const ns = document.getElementById('next-server');
       if (nr && sched.next_repo) nr.textContent = new Date(sched.next_repo).toLocaleString();
       if (ns && sched.next_server) ns.textContent = new Date(sched.next_server).toLocaleString();
+      (sched.items || []).forEach(i => { nextRuns[`${i.kind}:${i.name}`] = new Date(i.next_run).toLocaleString(); });
     } catch (e) { console.error(e); }
+    return nextRuns;
   }
 
   // Sanitize to reject any script tags in values
@@ -82,7 +94,7 @@ document.addEventListener('DOMContentLoaded', async () => {
   if (document.getElementById('repos-table')) {
     const triggerBtn = document.getElementById('trigger-repos');
     async function loadRepos() {
-      await loadSchedule();
+      const nextRuns = await loadSchedule();
       const repos = await request('/api/repos', { method: 'GET', headers });
       const tbody = document.querySelector('#repos-table tbody'); tbody.innerHTML = '';
       repos.forEach(r => {
@@ -92,7 +104,7 @@ document.addEventListener('DOMContentLoaded', async () => {
         const last_check = sanitizeVal(r.last_check);
         const last_commit = r.last_commit || '';
         const tr = document.createElement('tr');
-        tr.innerHTML = `<td>${name}</td><td>${branch}</td><td>${active}</td><td>${last_check}</td><td>${last_commit}</td><td><button class="btn btn-danger btn-sm" onclick="deleteRepo('${encodeURIComponent(name)}')">Delete</button></td>`;
+        tr.innerHTML = `<td>${name}</td><td>${branch}</td><td>${active}</td><td>${last_check}</td><td>${nextRuns[`repo:${r.name}`] || ''}</td><td>${last_commit}</td><td><button class="btn btn-danger btn-sm" onclick="deleteRepo('${encodeURIComponent(name)}')">Delete</button></td>`;
         tbody.appendChild(tr);
       });
     }
@@ -103,7 +115,9 @@ document.addEventListener('DOMContentLoaded', async () => {
     triggerBtn.addEventListener('click', async () => {
       triggerBtn.disabled = true;
       triggerBtn.textContent = 'Checking...';
-      await request('/api/check/repos', { method: 'POST', headers });
+      const queued = await request('/api/check/repos', { method: 'POST', headers });
+      const job = await waitForJob(queued.job_id);
+      if (job.state === 'failed') alert(job.error);
       await loadRepos();
       triggerBtn.textContent = 'Trigger Check';
       triggerBtn.disabled = false;
@@ -113,7 +127,12 @@ document.addEventListener('DOMContentLoaded', async () => {
       const name = e.target.repo.value;
       const branch = e.target.branch.value;
       const tokenVal = e.target.token.value;
-      await request('/api/repos', { method: 'POST', headers, body: JSON.stringify({ name, branch, token: tokenVal }) });
+      const webhookSecret = e.target.webhook_secret.value;
+      const interval = parseInt(e.target.interval.value, 10) || null;
+      const fetchStrategy = e.target.fetch.value;
+      const fetchDepth = parseInt(e.target.fetch_depth.value, 10) || null;
+      const reference = e.target.reference.value;
+      await request('/api/repos', { method: 'POST', headers, body: JSON.stringify({ name, branch, token: tokenVal, webhook_secret: webhookSecret, interval, fetch: fetchStrategy, fetch_depth: fetchDepth, reference }) });
       e.target.reset(); loadRepos();
     });
     loadRepos();
@@ -123,7 +142,7 @@ document.addEventListener('DOMContentLoaded', async () => {
   if (document.getElementById('servers-table')) {
     const triggerBtnS = document.getElementById('trigger-servers');
     async function loadServers() {
-      await loadSchedule();
+      const nextRuns = await loadSchedule();
       const svs = await request('/api/servers', { method: 'GET', headers });
       const tbody = document.querySelector('#servers-table tbody'); tbody.innerHTML = '';
       svs.forEach(s => {
@@ -134,7 +153,7 @@ document.addEventListener('DOMContentLoaded', async () => {
                             s.active === 'retry' ? '<span class="badge bg-warning">retry</span>' :
                             `<span class=\"badge bg-secondary\">${s.active}</span>`;
         const tr = document.createElement('tr');
-        tr.innerHTML = `<td>${host}</td><td>${user}</td><td>${statusBadge}</td><td>${sanitizeVal(s.last_check)}</td><td><button class="btn btn-danger btn-sm" onclick="deleteServer('${encodeURIComponent(host)}')">Delete</button></td>`;
+        tr.innerHTML = `<td>${host}</td><td>${user}</td><td>${statusBadge}</td><td>${sanitizeVal(s.last_check)}</td><td>${nextRuns[`server:${s.host}`] || ''}</td><td><button class="btn btn-danger btn-sm" onclick="deleteServer('${encodeURIComponent(host)}')">Delete</button></td>`;
         tbody.appendChild(tr);
       });
     }
@@ -142,7 +161,9 @@ document.addEventListener('DOMContentLoaded', async () => {
     triggerBtnS.addEventListener('click', async () => {
       triggerBtnS.disabled = true;
       triggerBtnS.textContent = 'Checking...';
-      await request('/api/check/servers', { method: 'POST', headers });
+      const queued = await request('/api/check/servers', { method: 'POST', headers });
+      const job = await waitForJob(queued.job_id, 2000);
+      if (job.state === 'failed') alert(job.error);
       await loadServers();
       triggerBtnS.textContent = 'Trigger Check';
       triggerBtnS.disabled = false;
@@ -152,7 +173,8 @@ document.addEventListener('DOMContentLoaded', async () => {
       const host = e.target.host.value;
       const user = e.target.user.value;
       const key = e.target.key.value;
-      await request('/api/servers', { method: 'POST', headers, body: JSON.stringify({ host, user, key }) });
+      const interval = parseInt(e.target.interval.value, 10) || null;
+      await request('/api/servers', { method: 'POST', headers, body: JSON.stringify({ host, user, key, interval }) });
       e.target.reset(); loadServers();
     });
     loadServers();
@@ -160,13 +182,36 @@ document.addEventListener('DOMContentLoaded', async () => {
 
   // Logs Page
   if (document.getElementById('activity-log')) {
+    // Per log: cursors for the next older page and for new lines since the last refresh
+    const cursors = { activity: {}, connectivity: {} };
+    async function loadLog(name) {
+      const pre = document.getElementById(`${name}-log`);
+      const cur = cursors[name];
+      const url = cur.since ? `/api/logs/${name}?since=${encodeURIComponent(cur.since)}` : `/api/logs/${name}?lines=100`;
+      const page = await request(url, { method: 'GET', headers });
+      if (!cur.since) {
+        pre.textContent = '';
+        cur.before = page.before;
+      }
+      if (page.lines.length) pre.textContent += page.lines.join('\n') + '\n';
+      cur.since = page.since;
+      pre.scrollTop = pre.scrollHeight;
+      if (page.more) return loadLog(name);
+    }
+    async function loadOlder(name) {
+      const cur = cursors[name];
+      if (!cur.before) return;
+      const page = await request(`/api/logs/${name}?lines=100&before=${encodeURIComponent(cur.before)}`, { method: 'GET', headers });
+      const pre = document.getElementById(`${name}-log`);
+      if (page.lines.length) pre.textContent = page.lines.join('\n') + '\n' + pre.textContent;
+      cur.before = page.before;
+    }
     async function loadLogs() {
-      const act = await request('/logs/activity', { method: 'GET', headers });
-      const conn = await request('/logs/connectivity', { method: 'GET', headers });
-      document.getElementById('activity-log').innerHTML = act.replace(/\n/g,'<br>');
-      document.getElementById('connectivity-log').innerHTML = conn.replace(/\n/g,'<br>');
+      await Promise.all([loadLog('activity'), loadLog('connectivity')]);
     }
     document.getElementById('refresh-logs').addEventListener('click', loadLogs);
+    document.querySelectorAll('[data-older-log]').forEach(btn =>
+      btn.addEventListener('click', () => loadOlder(btn.dataset.olderLog)));
     loadLogs();
   }
 
@@ -204,7 +249,40 @@ document.addEventListener('DOMContentLoaded', async () => {
       });
     }
     window.deleteCommand = async (id) => { await request(`/api/commands/${id}`, { method: 'DELETE', headers }); loadCommands(); };
-    window.runCommand = async (id) => { const json = await request(`/api/commands/${id}/run`, { method: 'POST', headers }); alert(JSON.stringify(json)); };
+    // Follow a command's run live; the stream waits for the run to start and replays what was missed
+    let runStream = null;
+    function followRun(id) {
+      const pre = document.getElementById('run-output');
+      const status = document.getElementById('run-output-status');
+      document.getElementById('run-output-panel').style.display = '';
+      pre.textContent = '';
+      status.textContent = `${id}: waiting...`;
+      if (runStream) runStream.close();
+      runStream = new EventSource(`/api/commands/${encodeURIComponent(id)}/stream?wait=30`);
+      runStream.addEventListener('start', e => { status.textContent = `${id}: ${JSON.parse(e.data).run_id}`; });
+      runStream.onmessage = e => {
+        const atBottom = pre.scrollTop + pre.clientHeight >= pre.scrollHeight - 5;
+        pre.textContent += e.data + '\n';
+        if (atBottom) pre.scrollTop = pre.scrollHeight;
+      };
+      runStream.addEventListener('stale', e => {
+        status.textContent = `${id}: ${JSON.parse(e.data).error}`;
+        runStream.close();
+      });
+      runStream.addEventListener('end', e => {
+        status.textContent = `${id}: exited with ${JSON.parse(e.data).exit_status}`;
+        runStream.close();
+      });
+      runStream.onerror = () => { if (runStream.readyState === EventSource.CLOSED) status.textContent = `${id}: stream closed`; };
+    }
+    window.runCommand = async (id) => {
+      followRun(id);
+      const queued = await request(`/api/commands/${id}/run`, { method: 'POST', headers });
+      const job = await waitForJob(queued.job_id);
+      if (job.state === 'failed') alert(job.error);
+      else if (job.result && job.result.error) alert(JSON.stringify(job.result));
+      loadCommands();
+    };
     window.manageSecrets = async (id) => {
       // Fetch existing secrets (masked)
       const secrets = await request(`/api/commands/${id}/secrets`, { method: 'GET', headers });
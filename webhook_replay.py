@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import hmac
+import json
+import time
+import uuid
+import requests
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay recorded GitHub webhook payloads against the runner")
+    parser.add_argument("payloads", nargs='+', help="Recorded payload files (JSON body of the delivery)")
+    parser.add_argument("--url", default="http://localhost:5000/api/webhooks/github", help="Webhook endpoint")
+    parser.add_argument("--secret", required=True, help="Webhook secret configured for the repo")
+    parser.add_argument("--event", default="push", help="X-GitHub-Event header to send")
+    parser.add_argument("--keep-pushed-at", action="store_true",
+                        help="Keep the recorded repository.pushed_at instead of setting it to now")
+    return parser.parse_args()
+
+
+def replay(path, args):
+    with open(path, 'r') as f:
+        payload = json.load(f)
+    # Stamp the push as happening now so the runner logs true push-to-deploy-start latency
+    if not args.keep_pushed_at and 'repository' in payload:
+        payload['repository']['pushed_at'] = int(time.time())
+    body = json.dumps(payload).encode()
+    signature = 'sha256=' + hmac.new(args.secret.encode(), body, hashlib.sha256).hexdigest()
+    headers = {
+        'Content-Type': 'application/json',
+        'X-GitHub-Event': args.event,
+        'X-GitHub-Delivery': str(uuid.uuid4()),
+        'X-Hub-Signature-256': signature,
+    }
+    started = time.monotonic()
+    resp = requests.post(args.url, data=body, headers=headers, timeout=30)
+    elapsed = (time.monotonic() - started) * 1000
+    print(f"{path}: HTTP {resp.status_code} in {elapsed:.0f}ms {resp.text.strip()}")
+
+
+def main():
+    args = parse_args()
+    for path in args.payloads:
+        replay(path, args)
+    print("Deploy start latency is logged by the runner as '[WEBHOOK] Deploying ...' in logs/activity.log")
+
+
+if __name__ == "__main__":
+    main()